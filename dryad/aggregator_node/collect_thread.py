@@ -7,18 +7,27 @@
 
 import logging
 import dryad.ble_utils as ble_utils
+import dryad.sys_info as sys_info
 
 from random import randint
 from time import sleep
 
 from threading import Thread, Event, Lock
-from queue import Queue
+from collections import OrderedDict
 
-from dryad.database import DryadDatabase
+from dryad.database import DryadDatabase, remove_session
+from dryad.aggregator_node.write_thread import WriteThread
+from dryad.aggregator_node.connect_scheduler import ConnectScheduler, CONN_DEADLINE
 from dryad.sensor_node.bluno_sensor_node import BlunoSensorNode
 from dryad.sensor_node.parrot_sensor_node import ParrotSensorNode
 
 MAX_QUEUE_TASKS = 4
+OFFLOAD_BATCH_SIZE = 100
+
+CHRONIC_FAILURE_COUNT       = 5     # Consecutive failed cycles before a node
+                                    #   is only sampled occasionally
+CHRONIC_FAILURE_SAMPLE_RATE = 4     # Chronic failures are tried in about one
+                                    #   out of this many cycles
 
 class CollectThread(Thread):
     def __init__(self, parent):
@@ -27,10 +36,11 @@ class CollectThread(Thread):
         self.logger = logging.getLogger("main.AggregatorNode.CollectThread")
         self.parent = parent
 
-        self.node_queue = None
+        self.scheduler = None
         self.node_queue_size = MAX_QUEUE_TASKS
 
         self.worker_threads = None
+        self.write_thread = None
         self.active_flag = False
         self.active_flag_lock = Lock()
 
@@ -74,12 +84,14 @@ class CollectThread(Thread):
         if node_info['type'] == ble_utils.NTYPE_BLUNO:
             return BlunoSensorNode( node_info['id'],
                                     node_info['addr'],
-                                    wait_event )
+                                    wait_event,
+                                    data_writer=self.write_thread )
 
         elif node_info['type'] == ble_utils.NTYPE_PARROT:
             return ParrotSensorNode( node_info['id'],
                                      node_info['addr'],
-                                     wait_event )
+                                     wait_event,
+                                     data_writer=self.write_thread )
 
         # if the node cannot be instantiated due to its type
         #   being unknown, then simply return None
@@ -87,44 +99,61 @@ class CollectThread(Thread):
 
     def process_node(self):
         while self.check_active():
-            node = self.node_queue.get()
-            if (node == None):
+            entry = self.scheduler.get()
+            if (entry == None):
                 break
 
+            node = entry['node']
             self.logger.debug("Processing {}...".format(node['id']))
             
             # Check if the node id is valid
             if (node['id'] == None) or (node['id'] == ''):
                 self.logger.info("Skipping blank \"node\" with address {}".format(node['addr']))
-                self.node_queue.task_done()
+                self.scheduler.done(entry)
                 continue
 
             # Classify the node if it hasn't been classified yet
             if node['class'] == ble_utils.NCLAS_UNKNOWN:
                 result = self.classify_node(node)
                 if result == False:
-                    self.node_queue.task_done()
+                    self.scheduler.done(entry)
                     continue
 
-            # Based on the node type, instantiate a Node object and read
-            wait_event = Event()
-            node_instance = self.instantiate_node(node, wait_event)
+            # Based on the node type, instantiate a Node object and read.
+            #   The instance is kept around for later connection attempts
+            if 'instance' not in entry:
+                entry['wait_event'] = Event()
+                entry['instance'] = self.instantiate_node(node, entry['wait_event'])
+
+            wait_event = entry['wait_event']
+            node_instance = entry['instance']
             if node_instance == None:
                 self.logger.error( "Could not instantiate node: {} ({})".format(
                                     node['id'], node['addr']) )
 
-                self.node_queue.task_done()
+                self.scheduler.done(entry)
                 continue
 
-            if node_instance.connect() == False:
+            # Only make a single connection attempt at a time so that other
+            #   nodes get their turn while this one backs off
+            if node_instance.connect(max_retries=1) == False:
+                # Attempts that time out mean that the node is most likely
+                #   absent, so it is not worth holding up a worker for it
+                if node_instance.is_conn_timed_out:
+                    self.scheduler.done(entry)
+
+                elif self.scheduler.retry(entry, node_instance.max_conn_retries) == True:
+                    continue
+
                 self.logger.error( "Could not connect to node: {} ({})".format(
                                     node['id'], node['addr']) )
+                self.record_link_stats(node, node_instance)
 
-                self.node_queue.task_done()
                 continue
 
             if self.check_active() == False:
-                self.node_queue.task_done()
+                self.record_link_stats(node, node_instance)
+                self.scheduler.done(entry)
                 continue
 
             node_instance.start()
@@ -136,93 +165,160 @@ class CollectThread(Thread):
 
             node_instance.stop()
 
-            self.node_queue.task_done()
+            self.record_link_stats(node, node_instance)
+            self.scheduler.done(entry)
             if node != None:
                 self.logger.debug("Processed {}!".format(node['id']))
 
+        remove_session()
+
         return
 
+    def record_link_stats(self, node, node_instance):
+        db = DryadDatabase()
+        result = db.update_node_link_stats( address       = node['addr'],
+                                            node_id       = node['id'],
+                                            attempts      = node_instance.connect_attempts,
+                                            connected     = node_instance.connect_time != None,
+                                            connect_time  = node_instance.connect_time,
+                                            read_duration = node_instance.read_duration )
+        db.close_session()
+
+        if result == False:
+            self.logger.error("Unable to update link stats for {}".format(node['id']))
+
+        return result
+
+    # @desc     Orders nodes by their connection history so that reliable,
+    #           fast nodes are collected from first. Nodes which have failed
+    #           for several cycles in a row are only tried now and then
+    # @return   The ordered list of nodes to collect from
+    def order_nodes(self, node_list):
+        db = DryadDatabase()
+        records = db.get_node_link_stats()
+        db.close_session()
+
+        link_stats = {}
+        if records != False:
+            for stats in records:
+                link_stats[stats.address] = stats
+
+        ordered_nodes = []
+        for node in node_list:
+            stats = link_stats.get(node['addr'])
+            if (stats != None) and \
+               (stats.consecutive_failures >= CHRONIC_FAILURE_COUNT) and \
+               (randint(1, CHRONIC_FAILURE_SAMPLE_RATE) != 1):
+                self.logger.info("Skipping unreliable node this cycle: {} ({})".format(
+                                    node['id'], node['addr']))
+                continue
+
+            ordered_nodes.append(node)
+
+        def node_priority(node):
+            stats = link_stats.get(node['addr'])
+
+            # Nodes without any history yet go in between the reliable
+            #   nodes and the unreliable ones
+            if (stats == None) or (stats.success_rate == None):
+                return (-0.5, 0.0)
+
+            connect_time = stats.avg_connect_time
+            if connect_time == None:
+                connect_time = 0.0
+
+            return (-stats.success_rate, connect_time)
+
+        # Sorting is stable, so ties keep the order of the node list
+        ordered_nodes.sort(key=node_priority)
+
+        return ordered_nodes
+
     def offload_data(self):
         db = DryadDatabase()
-        
-        session_data = db.get_session_data()
-        self.logger.debug(session_data)
 
-        blk_count = 0
-        curr_session = 0
-        prev_session = 0
-       
         n_params = 13 # ideal number of parameters per data block
-        data_blocks = {}
-        offloaded_data = {}
 
-        for reading in session_data:
-            # Save the current session id
-            curr_session = reading.session_id
+        blk_count = 0
+        curr_source_id = None
+        result = True
+
+        # Open data blocks of the current source, keyed by block index, and
+        #   the number of blocks each data key has been added to so far
+        data_blocks = OrderedDict()
+        key_counts = {}
+
+        offloaded_data = []
+
+        # Session data is ordered by source id, so once the source changes
+        #   all data blocks of the previous source are already complete
+        for reading in db.iter_session_data():
+            if reading.source_id != curr_source_id:
+                offloaded_data.extend(data_blocks.values())
+                data_blocks = OrderedDict()
+                key_counts = {}
+                curr_source_id = reading.source_id
 
             # Extract the data type and value from the 'content' string
-            data_key = reading.content.split(":")[0].strip()
-            data_val  = reading.content.split(":")[1].strip()
-            data_source_id = reading.source_id
-            
-            # Boolean indicator whether data key exists in a data block
-            key_exists = True 
-           
-            # Check if source id exists in current data blocks
-            if data_source_id in data_blocks.keys():
-                source_id_readings = data_blocks[data_source_id]
-                for i in range(len(source_id_readings)):
-                    if data_key in source_id_readings[i].keys():
-                        # Go to the next source id reading
-                        continue
-                    
-                    # If the data key is not existing on the source id readings
-                    key_exists = False
-                    data_blocks[data_source_id][i][data_key] = data_val
-
-                    # Add block to offloaded_data if complete
-                    if len(data_blocks[data_source_id][i]) == n_params:
-                        if data_source_id not in offloaded_data.keys():
-                            offloaded_data[data_source_id] = [data_blocks[data_source_id][i]]
-                        else:
-                            offloaded_data[data_source_id].append(data_blocks[data_source_id][i])
-                        # Remove datum that has been offloaded
-                        del data_blocks[data_source_id][i]
-                    # Go to the next reading
-                    break
-                if key_exists is True:
-                    data_blocks[data_source_id].append({data_key: data_val})
-
-            # Initialize data block if source id not existing
-            else:
-                data_blocks[data_source_id] = [{data_key: data_val}]
-
-        # Add remaining data blocks to offload         
-        for key, block in data_blocks.items():
-            for reading_set in block:
-                if len(reading_set) is not 0:
-                    if key not in offloaded_data.keys():
-                        offloaded_data[key] = [reading_set]
-                    else:
-                        offloaded_data[key].append(reading_set)
-        
-        blk_count = 0
-        # Add offloaded data to database
-        for source, block in offloaded_data.items():
-            for reading_set in block:
-                # Save the block to the database
-                db.add_data( blk_id=blk_count,
-                             session_id=curr_session,
-                             source_id=source,
-                             content=str(reading_set),
-                             timestamp=reading.timestamp )
-                blk_count += 1
-
-        db.clear_session_data()
+            content_parts = reading.content.split(":", 1)
+            data_key = content_parts[0].strip()
+            data_val = content_parts[1].strip()
+
+            # Each data key goes into the earliest block that lacks it
+            blk_idx = key_counts.get(data_key, 0)
+            key_counts[data_key] = blk_idx + 1
+
+            if blk_idx not in data_blocks:
+                data_blocks[blk_idx] = { 'session_id' : reading.session_id,
+                                         'source_id'  : reading.source_id,
+                                         'timestamp'  : reading.timestamp,
+                                         'content'    : {} }
+
+            block = data_blocks[blk_idx]
+            block['content'][data_key] = data_val
+
+            # Offload the block once it is complete
+            if len(block['content']) == n_params:
+                offloaded_data.append(data_blocks.pop(blk_idx))
+
+            if len(offloaded_data) >= OFFLOAD_BATCH_SIZE:
+                if self.save_data_blocks(db, offloaded_data, blk_count) == False:
+                    result = False
+
+                blk_count += len(offloaded_data)
+                offloaded_data = []
+
+        # Add remaining data blocks to offload
+        offloaded_data.extend(data_blocks.values())
+        if self.save_data_blocks(db, offloaded_data, blk_count) == False:
+            result = False
+
+        # Keep the session data around if some blocks were not saved
+        if result == False:
+            self.logger.error("Failed to offload some data blocks")
+        else:
+            db.clear_session_data()
 
         db.close_session()
 
-        return
+        return result
+
+    def save_data_blocks(self, db, blocks, blk_count):
+        records = []
+        for block in blocks:
+            record = { 'blk_id'     : blk_count,
+                       'session_id' : block['session_id'],
+                       'source_id'  : block['source_id'],
+                       'content'    : None,
+                       'timestamp'  : block['timestamp'] }
+
+            # Store the block values as packed numbers under a sensor schema
+            record.update(db.pack_data_content(block['content']))
+
+            records.append(record)
+            blk_count += 1
+
+        return db.add_data_bulk(records)
 
     def setup_worker_threads(self):
         self.worker_threads = []
@@ -234,23 +330,37 @@ class CollectThread(Thread):
             db.terminate_session()
 
         db.start_session()
+        session = db.get_current_session()
         db.close_session()
 
+        if session == False:
+            self.logger.error("Unable to start a new session")
+            return False
+
+        # Start the thread which batches readings into the session data
+        self.write_thread = WriteThread(session.id)
+        self.write_thread.start()
+
         for i in range(self.node_queue_size):
             t = Thread(target=self.process_node)
             t.start()
             self.worker_threads.append(t)
 
-        return
+        return True
 
     def cleanup_worker_threads(self):
-        for i in range(self.node_queue_size):
-            self.node_queue.put(None)
+        # Release any workers still waiting on the scheduler
+        self.scheduler.cancel()
 
         for t in self.worker_threads:
             self.logger.debug("Cleaning up thread: {}".format(t.name))
             t.join()
 
+        # Flush any readings still queued for writing
+        if self.write_thread != None:
+            self.write_thread.stop()
+            self.write_thread = None
+
         db = DryadDatabase()
         db.terminate_session()
         db.close_session()
@@ -261,7 +371,8 @@ class CollectThread(Thread):
         self.set_active(True)
 
         self.logger.debug("Data collection started")
-        self.node_queue = Queue(self.node_queue_size)
+        self.scheduler = ConnectScheduler(sys_info.get_float_param("CONN_DEADLINE",
+                                                                   CONN_DEADLINE))
 
         # Load node list from the Aggregator Node
         node_list = self.parent.get_node_list()
@@ -269,15 +380,19 @@ class CollectThread(Thread):
             self.logger.error("Error could not reload node list!")
             return
 
-        self.setup_worker_threads()
-
-        # Add nodes to the queue
-        for node in node_list:
+        # Add nodes to the schedule, most reliable first
+        for node in self.order_nodes(node_list):
             self.logger.debug("Added node to queue: {}".format(node['id']))
-            self.node_queue.put(node)
+            self.scheduler.add(node)
 
-        # Wait until all nodes enqueued have been processed
-        self.node_queue.join()
+        if self.setup_worker_threads() == False:
+            self.logger.error("Data collection aborted")
+            self.set_active(False)
+            self.parent.add_task("STOP_COLLECT")
+            return
+
+        # Wait until all scheduled nodes have been processed
+        self.scheduler.join()
         self.logger.debug("All nodes processed!")
 
         # Cleanup remaining threads
@@ -299,6 +414,9 @@ class CollectThread(Thread):
 
         self.set_active(False)
 
+        if self.scheduler != None:
+            self.scheduler.cancel()
+
         for event in self.active_wait_events:
             event['event'].set()
             self.active_wait_events.remove(event) # TODO Not sure if safe or...
@@ -0,0 +1,144 @@
+#
+#   Connect Scheduler Class
+#   Author: Francis T
+#
+#   Schedules connection attempts to sensor nodes across the collector
+#   worker threads, letting other nodes go ahead of unreachable ones
+#
+
+import heapq
+import logging
+
+from random import uniform
+from time import time
+from threading import Condition
+
+CONN_BACKOFF_INITIAL    = 1.0           # Seconds to wait after the first failure
+CONN_BACKOFF_MAX        = 60.0
+CONN_BACKOFF_JITTER     = 0.5           # Max jitter as a fraction of the backoff
+CONN_DEADLINE           = 60.0 * 15.0   # Max seconds to keep retrying nodes
+
+class ConnectScheduler():
+    def __init__(self, deadline=CONN_DEADLINE):
+        self.logger = logging.getLogger("main.AggregatorNode.ConnectScheduler")
+
+        self.deadline = time() + deadline
+
+        # Pending nodes, ordered by the time they can next be attempted
+        self.pending = []
+        self.pending_count = 0
+        self.unfinished = 0
+        self.is_cancelled = False
+
+        self.cond = Condition()
+
+        return
+
+    def add(self, node):
+        entry = { 'node' : node, 'attempts' : 0 }
+
+        self.cond.acquire()
+        self.push(time(), entry)
+        self.unfinished += 1
+        self.cond.notify()
+        self.cond.release()
+
+        return entry
+
+    # @desc     Waits for the next node that is due for a connection attempt
+    # @return   A node entry, or None once there are no more nodes to process
+    def get(self):
+        self.cond.acquire()
+        try:
+            while not self.is_cancelled:
+                if len(self.pending) <= 0:
+                    if self.unfinished <= 0:
+                        break
+
+                    # Nodes being processed by other workers may still be
+                    #   scheduled for another attempt
+                    self.cond.wait()
+                    continue
+
+                ready_time = self.pending[0][0]
+                wait_time = ready_time - time()
+                if wait_time <= 0.0:
+                    return heapq.heappop(self.pending)[2]
+
+                self.cond.wait(wait_time)
+
+        finally:
+            self.cond.release()
+
+        return None
+
+    # @desc     Schedules another connection attempt for a node after an
+    #           exponentially increasing, jittered backoff
+    # @return   True if the node was rescheduled, False if it was dropped
+    def retry(self, entry, max_attempts):
+        self.cond.acquire()
+        try:
+            entry['attempts'] += 1
+
+            backoff = min(CONN_BACKOFF_INITIAL * (2 ** (entry['attempts'] - 1)),
+                          CONN_BACKOFF_MAX)
+            backoff += uniform(0.0, backoff * CONN_BACKOFF_JITTER)
+
+            ready_time = time() + backoff
+
+            # Give up on the node if it has run out of attempts or if its
+            #   next attempt would fall beyond this cycle's deadline
+            if (entry['attempts'] >= max_attempts) or \
+               (ready_time > self.deadline) or \
+               self.is_cancelled:
+                self.logger.info("Giving up on {} after {} attempts".format(
+                                    entry['node']['id'], entry['attempts']))
+                self.finish()
+                return False
+
+            self.push(ready_time, entry)
+            self.cond.notify()
+
+        finally:
+            self.cond.release()
+
+        return True
+
+    def done(self, entry):
+        self.cond.acquire()
+        self.finish()
+        self.cond.release()
+
+        return
+
+    # @desc     Waits until all nodes have either been processed or dropped
+    # @return   None
+    def join(self):
+        self.cond.acquire()
+        while (self.unfinished > 0) and (not self.is_cancelled):
+            self.cond.wait()
+        self.cond.release()
+
+        return
+
+    def cancel(self):
+        self.cond.acquire()
+        self.is_cancelled = True
+        self.cond.notify_all()
+        self.cond.release()
+
+        return
+
+    def push(self, ready_time, entry):
+        # The counter keeps nodes with the same ready time in FIFO order
+        heapq.heappush(self.pending, (ready_time, self.pending_count, entry))
+        self.pending_count += 1
+
+        return
+
+    def finish(self):
+        self.unfinished -= 1
+        self.cond.notify_all()
+
+        return
+
@@ -9,14 +9,17 @@ import dryad.sys_info as sys_info
 import dryad.ble_utils as ble_utils
 
 from time import time
-from queue import Queue
-from threading import Event, Timer, Lock, Thread
+from queue import PriorityQueue
+from threading import Lock, Thread
 from dryad.aggregator_node.collect_thread import CollectThread
+from dryad.aggregator_node.task_scheduler import TaskScheduler
+from dryad.aggregator_node.task import Task, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
 from dryad.database import DryadDatabase
 from dryad.aggregator_node.network import BaseAggregatorNodeNetwork
 from dryad.external_switches import ExternalSwitch
 
-TASK_EVENT_TIMEOUT      = 120.0
+TIMER_COLLECTION    = "COLLECTION"
+TIMER_IDLE_OUT      = "IDLE_OUT"
 
 RESULT_FATAL    = -3
 RESULT_SHUTDOWN = -2
@@ -80,23 +83,25 @@ class AggregatorNode(BaseAggregatorNodeNetwork):
 
         self.logger = logging.getLogger("main.AggregatorNode")
 
-        self.task_queue = Queue()
-        self.task_event = Event()
+        self.task_queue = PriorityQueue()
+        self.task_count = 0
         self.task_lock = Lock()
-        self.task_tbl = [
-            { "id" : "ACTIVATE",      "func" : self.activate_node },
-            { "id" : "DEACTIVATE",    "func" : self.deactivate_node },
-            { "id" : "SET_PARAMS",    "func" : self.set_system_params },
-            { "id" : "START_COLLECT", "func" : self.start_data_collection },
-            { "id" : "STOP_COLLECT",  "func" : self.stop_data_collection },
-            { "id" : "NET_UPDATE",    "func" : self.update_network },
-            { "id" : "EXTEND_IDLE",   "func" : self.extend_idle_period },
-            { "id" : "END_IDLE",      "func" : self.idle_out },
-            { "id" : "SUSPEND",       "func" : self.suspend_node },
-            { "id" : "RELOAD",        "func" : self.reload_node },
-            { "id" : "REBOOT",        "func" : self.reboot_node },
-            { "id" : "SHUTDOWN",      "func" : self.shutdown_node },
-        ]
+        self.task_scheduler = TaskScheduler(self.add_task)
+        self.task_tbl = {
+            "ACTIVATE"      : { "func" : self.activate_node,         "priority" : PRIORITY_NORMAL },
+            "DEACTIVATE"    : { "func" : self.deactivate_node,       "priority" : PRIORITY_NORMAL },
+            "SET_PARAMS"    : { "func" : self.set_system_params,     "priority" : PRIORITY_NORMAL },
+            "RELOAD_PARAMS" : { "func" : self.reload_params,         "priority" : PRIORITY_NORMAL },
+            "START_COLLECT" : { "func" : self.start_data_collection, "priority" : PRIORITY_NORMAL },
+            "STOP_COLLECT"  : { "func" : self.stop_data_collection,  "priority" : PRIORITY_HIGH },
+            "NET_UPDATE"    : { "func" : self.update_network,        "priority" : PRIORITY_LOW },
+            "EXTEND_IDLE"   : { "func" : self.extend_idle_period,    "priority" : PRIORITY_NORMAL },
+            "END_IDLE"      : { "func" : self.idle_out,              "priority" : PRIORITY_HIGH },
+            "SUSPEND"       : { "func" : self.suspend_node,          "priority" : PRIORITY_HIGH },
+            "RELOAD"        : { "func" : self.reload_node,           "priority" : PRIORITY_HIGH },
+            "REBOOT"        : { "func" : self.reboot_node,           "priority" : PRIORITY_HIGH },
+            "SHUTDOWN"      : { "func" : self.shutdown_node,         "priority" : PRIORITY_HIGH },
+        }
 
         self.state = STATE_UNKNOWN
         self.state_lock = Lock()
@@ -104,11 +109,9 @@ class AggregatorNode(BaseAggregatorNodeNetwork):
         self.aggregator_thread = None
         self.collector_thread = None
 
-        self.collection_timer = None
         self.collection_time = None
         self.collection_interval = COLLECTION_INTERVAL
 
-        self.idle_out_timer = None
         self.idle_out_time = None
         self.idle_out_interval = IDLE_OUT_INTERVAL
 
@@ -134,6 +137,9 @@ class AggregatorNode(BaseAggregatorNodeNetwork):
         # Reload network information
         self.reload_network_info()
 
+        # Start the thread which queues timed tasks
+        self.task_scheduler.start()
+
         # Start the aggregator node thread
         self.aggregator_thread = AggregatorThread(self, event_complete)
         self.aggregator_thread.start()
@@ -159,10 +165,25 @@ class AggregatorNode(BaseAggregatorNodeNetwork):
 
         return
 
-    def add_task(self, task):
+    # @desc     Queues a task given either as a Task object or as a task id
+    #           with a dict of arguments. Tasks without a priority of their
+    #           own take the one registered for their task id
+    # @return   None
+    def add_task(self, task, args=None, priority=None):
+        if not isinstance(task, Task):
+            task = Task(task, args, priority)
+
+        if task.priority == None:
+            task.priority = PRIORITY_NORMAL
+            if task.id in self.task_tbl:
+                task.priority = self.task_tbl[task.id]['priority']
+
         self.task_lock.acquire()
-        self.task_queue.put(task)
-        self.task_event.set()
+
+        # The counter keeps tasks of the same priority in FIFO order
+        self.task_queue.put( (task.priority, self.task_count, task) )
+        self.task_count += 1
+
         self.task_lock.release()
 
         return
@@ -264,28 +285,24 @@ class AggregatorNode(BaseAggregatorNodeNetwork):
     def suspend_node(self, args=None):
         self.terminate_node()
         self.set_exit_code(EXIT_SUSPEND)
-        self.task_event.set()
 
         return RESULT_OK
 
     def reload_node(self, args=None):
         self.terminate_node()
         self.set_exit_code(EXIT_RELOAD)
-        self.task_event.set()
 
         return RESULT_OK
 
     def reboot_node(self, args=None):
         self.terminate_node()
         self.set_exit_code(EXIT_REBOOT)
-        self.task_event.set()
 
         return RESULT_OK
 
     def shutdown_node(self, args=None):
         self.terminate_node()
         self.set_exit_code(EXIT_POWEROFF)
-        self.task_event.set()
 
         return RESULT_OK
 
@@ -306,16 +323,19 @@ class AggregatorNode(BaseAggregatorNodeNetwork):
     def set_system_params(self, args=None):
         self.logger.info("[TASK] Setting system params")
 
-        arg_parts = args[0].split("=", 1)
-        if len(arg_parts) != 2:
+        if (args == None) or (len(args) <= 0):
             return RESULT_FAIL
 
-        param_name  = arg_parts[0]
-        param_value = arg_parts[1]
+        for param_name, param_value in args.items():
+            sys_info.set_param(param_name, str(param_value))
+
+        # Reload our parameters from the database
+        return self.reload_params()
 
-        sys_info.set_param(param_name, str(param_value))
+    def reload_params(self, args=None):
+        self.logger.info("[TASK] Reloading system params")
 
-        # Reload our parameters
+        sys_info.invalidate_params()
         self.reload_system_params()
 
         return RESULT_OK
@@ -324,41 +344,23 @@ class AggregatorNode(BaseAggregatorNodeNetwork):
         reload_idle_out_timer = False
         reload_collection_timer = False
 
-        records = sys_info.get_param("COLLECTION_INTERVAL")
-        if records != False:
-            new_value = float(records[0].value)
-            if abs(new_value - self.collection_interval) > 1:
-                reload_collection_timer = True
+        new_value = sys_info.get_float_param("COLLECTION_INTERVAL", COLLECTION_INTERVAL)
+        if abs(new_value - self.collection_interval) > 1:
+            reload_collection_timer = True
 
-            self.collection_interval = new_value
+        self.collection_interval = new_value
 
-        else:
-            sys_info.set_param("COLLECTION_INTERVAL", str(COLLECTION_INTERVAL))
+        new_value = sys_info.get_float_param("IDLE_OUT_INTERVAL", IDLE_OUT_INTERVAL)
+        if abs(new_value - self.idle_out_interval) > 1:
+            reload_idle_out_timer = True
 
-        records = sys_info.get_param("IDLE_OUT_INTERVAL")
-        if records != False:
-            new_value = float(records[0].value)
-            if abs(new_value - self.idle_out_interval) > 1:
-                reload_idle_out_timer = True
+        self.idle_out_interval = new_value
 
-            self.idle_out_interval = new_value
+        self.net_update_interval = sys_info.get_float_param("NET_UPDATE_INTERVAL",
+                                                            NET_UPDATE_INTERVAL)
 
-        else:
-            sys_info.set_param("IDLE_OUT_INTERVAL", str(IDLE_OUT_INTERVAL))
-
-        records = sys_info.get_param("NET_UPDATE_INTERVAL")
-        if records != False:
-            self.net_update_interval = float(records[0].value)
-
-        else:
-            sys_info.set_param("NET_UPDATE_INTERVAL", str(NET_UPDATE_INTERVAL))
-
-        records = sys_info.get_param("DEPLOYMENT_STATUS")
-        if records != False:
-            self.deployment_status = int(records[0].value)
-
-        else:
-            sys_info.set_param("DEPLOYMENT_STATUS", str(STATUS_NOT_DEPLOYED))
+        self.deployment_status = sys_info.get_int_param("DEPLOYMENT_STATUS",
+                                                        STATUS_NOT_DEPLOYED)
 
         param_out_str  = "[AGGREGATOR] Parameters: "
         param_out_str += "Collection Interval = {}, "
@@ -376,60 +378,37 @@ class AggregatorNode(BaseAggregatorNodeNetwork):
         
         return
 
-    # Timer Activated Functions
-    def add_start_data_collection_task(self):
-        self.add_task("START_COLLECT")
-        return
-
+    # Timer Functions
     def set_idle_out_timer(self):
-        # Cancel the old timer if it exists
-        if self.cancel_idle_out_timer() != RESULT_OK:
-            self.logger.error("Failed to cancel old idle out timer")
-            return RESULT_FAIL
-
-        # Re-create the idle out timer
-        self.idle_out_timer = Timer ( self.idle_out_interval,
-                                      self.idle_out )
-        self.idle_out_timer.start()
-        self.idle_out_time = time() + self.idle_out_interval
+        # Replaces the old timer if it is still pending
+        self.idle_out_time = self.task_scheduler.schedule( TIMER_IDLE_OUT,
+                                                           self.idle_out_interval,
+                                                           "END_IDLE" )
 
         return RESULT_OK
 
     def cancel_idle_out_timer(self):
-        if self.idle_out_timer != None:
-            if self.idle_out_timer.is_alive():
-                self.idle_out_timer.cancel()
-                self.idle_out_timer.join(15.0)
-
-            self.idle_out_timer = None
+        self.task_scheduler.cancel(TIMER_IDLE_OUT)
 
         return RESULT_OK
 
     def set_collection_timer(self):
-        # Cancel the old timer if it exists
-        if self.cancel_collection_timer() != RESULT_OK:
-            self.logger.error("Failed to cancel old collection timer")
-            return RESULT_FAIL
-
-        # Re-create the collection timer
-        self.collection_timer = Timer ( self.collection_interval,
-                                        self.add_start_data_collection_task )
+        # Only start the collection timer if the aggregator is currently active
+        if self.get_state() <= STATE_INACTIVE:
+            self.cancel_collection_timer()
+            self.collection_time = time() + self.collection_interval
 
-        # Start the collection timer if the aggregator is currently active
-        if self.get_state() > STATE_INACTIVE:
-            self.collection_timer.start()
+            return RESULT_OK
 
-        self.collection_time = time() + self.collection_interval
+        # Replaces the old timer if it is still pending
+        self.collection_time = self.task_scheduler.schedule( TIMER_COLLECTION,
+                                                             self.collection_interval,
+                                                             "START_COLLECT" )
 
         return RESULT_OK
 
     def cancel_collection_timer(self):
-        if self.collection_timer != None:
-            if self.collection_timer.is_alive():
-                self.collection_timer.cancel()
-                self.collection_timer.join(15.0)
-
-            self.collection_timer = None
+        self.task_scheduler.cancel(TIMER_COLLECTION)
 
         return RESULT_OK
 
@@ -437,47 +416,28 @@ class AggregatorNode(BaseAggregatorNodeNetwork):
     def await_tasks(self):
         result = RESULT_UNKNOWN
         while (result >= RESULT_FAIL) and (self.should_continue_running()):
-            # If the task queue is empty, then wait for new events to come up
+            # Block until a task comes in, either directly or from a timer
             if self.task_queue.empty():
                 self.logger.info("Waiting for tasks...")
-                self.task_event.wait(TASK_EVENT_TIMEOUT)
-                self.task_event.clear()
-
-                if self.task_queue.empty():
-                    self.logger.debug("Timed out.")
-                    # Evaluate if we should continue
-                    continue
 
-            task = self.task_queue.get()
+            priority, count, task = self.task_queue.get()
             try:
                 result = self.process_task(task)
             except Exception as e:
                 self.logger.exception("Exception Occurred: {}".format(str(e)))
                 break
 
+        # No more timed tasks will be handled from here on
+        self.task_scheduler.stop()
+
         return
 
     def process_task(self, task):
-        task_part = task.split(" ", 1)
-        task_cmd  = task_part[0]
-        task_args = None
-
-        # Check if the task has arguments, if so process them
-        if len(task_part) == 2:
-            task_args = task_part[1].split(",")
-
-        task_func = None
-        for known_task in self.task_tbl:
-            if task_cmd.startswith(known_task['id']):
-                task_func = known_task['func']
-                # self.logger.debug("Args: {}".format(task_args))
-                break
-
-        if task_func == None:
+        if task.id not in self.task_tbl:
             self.logger.debug("No handlers found for task: {}".format(task))
             return False
-        
-        return task_func(task_args)
+
+        return self.task_tbl[task.id]['func'](task.args)
 
     def should_continue_running(self):
         if (self.get_state() < STATE_INACTIVE):
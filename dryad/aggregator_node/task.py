@@ -0,0 +1,45 @@
+#
+#   Aggregator Node Task
+#   Author: Francis T
+#
+#   Task objects queued for the Aggregator Node to carry out
+#
+
+# Lower values are handled first
+PRIORITY_HIGH       = 0
+PRIORITY_NORMAL     = 1
+PRIORITY_LOW        = 2
+
+class Task():
+    def __init__(self, task_id, args=None, priority=None):
+        self.id = task_id
+        self.priority = priority
+
+        # Task arguments, keyed by argument name
+        self.args = args
+        if self.args == None:
+            self.args = {}
+
+        return
+
+    def __repr__(self):
+        return "<Task(id={}, args={}, priority={}>".format(
+            self.id, self.args, self.priority)
+
+# @desc     Parses a task written as "<TASK_ID> <name>=<value>,..." such as
+#           those entered through the debug console
+# @return   A Task object
+def parse_task(task_str):
+    task_parts = task_str.strip().split(" ", 1)
+
+    args = {}
+    if len(task_parts) == 2:
+        for arg in task_parts[1].split(","):
+            arg_parts = arg.split("=", 1)
+            if len(arg_parts) != 2:
+                continue
+
+            args[arg_parts[0].strip()] = arg_parts[1].strip()
+
+    return Task(task_parts[0], args)
+
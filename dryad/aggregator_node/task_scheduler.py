@@ -0,0 +1,116 @@
+#
+#   Task Scheduler Class
+#   Author: Francis T
+#
+#   Single thread which hands timed tasks over to the Aggregator Node's
+#   task queue once they are due
+#
+
+import heapq
+import logging
+
+from time import time
+from threading import Thread, Condition
+
+class TaskScheduler(Thread):
+    def __init__(self, func_add_task):
+        Thread.__init__(self)
+
+        self.logger = logging.getLogger("main.AggregatorNode.TaskScheduler")
+        self.add_task = func_add_task
+
+        # Timed tasks ordered by due time. Cancelled entries are only
+        #   marked as such and then skipped once they reach the top
+        self.timed_tasks = []
+        self.task_count = 0
+
+        # Latest scheduled entry for each named timer
+        self.timers = {}
+
+        self.is_running = True
+        self.cond = Condition()
+
+        return
+
+    # @desc     Schedules a task to be queued after a delay. Scheduling a
+    #           timer which is already pending replaces it
+    # @return   The time at which the task is due
+    def schedule(self, name, delay, task):
+        due_time = time() + delay
+        entry = { 'name' : name, 'task' : task, 'is_cancelled' : False }
+
+        self.cond.acquire()
+        self.cancel_timer(name)
+        self.timers[name] = entry
+
+        # The counter keeps tasks due at the same time in FIFO order
+        heapq.heappush(self.timed_tasks, (due_time, self.task_count, entry))
+        self.task_count += 1
+
+        self.cond.notify()
+        self.cond.release()
+
+        return due_time
+
+    def cancel(self, name):
+        self.cond.acquire()
+        self.cancel_timer(name)
+        self.cond.release()
+
+        return
+
+    def is_pending(self, name):
+        self.cond.acquire()
+        result = (name in self.timers)
+        self.cond.release()
+
+        return result
+
+    def stop(self):
+        self.cond.acquire()
+        self.is_running = False
+        self.cond.notify()
+        self.cond.release()
+
+        if self.is_alive():
+            self.join()
+
+        return
+
+    def run(self):
+        self.cond.acquire()
+        try:
+            while self.is_running:
+                if len(self.timed_tasks) <= 0:
+                    self.cond.wait()
+                    continue
+
+                due_time, count, entry = self.timed_tasks[0]
+                if entry['is_cancelled']:
+                    heapq.heappop(self.timed_tasks)
+                    continue
+
+                wait_time = due_time - time()
+                if wait_time > 0.0:
+                    self.cond.wait(wait_time)
+                    continue
+
+                heapq.heappop(self.timed_tasks)
+                del self.timers[entry['name']]
+
+                self.logger.debug("Timer {} is due".format(entry['name']))
+                self.add_task(entry['task'])
+
+        finally:
+            self.cond.release()
+
+        return
+
+    def cancel_timer(self, name):
+        # Must be called while holding the condition's lock
+        entry = self.timers.pop(name, None)
+        if entry != None:
+            entry['is_cancelled'] = True
+
+        return
+
@@ -0,0 +1,162 @@
+#
+#   Write Thread Class
+#   Author: Francis T
+#
+#   Thread for batching the readings of all read threads into the
+#   session data cache
+#
+
+import logging
+
+from time import time
+from queue import Queue, Empty, Full
+from threading import Thread
+
+from dryad.database import DryadDatabase, remove_session
+
+MAX_QUEUED_ROWS     = 512
+MAX_BATCH_SIZE      = 64
+FLUSH_INTERVAL      = 5.0       # Max number of seconds between flushes
+QUEUE_PUT_TIMEOUT   = 30.0
+MAX_FLUSH_ATTEMPTS  = 3         # Max number of flushes to try writing rows in
+
+class WriteThread(Thread):
+    def __init__(self, session_id, batch_size=MAX_BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, queue_size=MAX_QUEUED_ROWS):
+        Thread.__init__(self)
+
+        self.logger = logging.getLogger("main.AggregatorNode.WriteThread")
+        self.session_id = session_id
+
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # Bounded so that read threads block when writes fall behind
+        self.row_queue = Queue(queue_size)
+
+        # Rows which failed to be written, kept per table for the next flush
+        self.failed_rows = { 'readings' : [], 'raw samples' : [] }
+        self.failed_flushes = { 'readings' : 0, 'raw samples' : 0 }
+
+        return
+
+    def add_reading(self, source_id, reading):
+        # Store the timestamp parameter
+        ts = reading['ts']
+
+        # Queue all other values
+        for key in reading:
+            if key == 'ts':
+                continue
+
+            row = { 'session_id' : self.session_id,
+                    'source_id'  : source_id,
+                    'content'    : str("{}: {}".format(key, reading[key])),
+                    'timestamp'  : ts }
+
+            try:
+                self.row_queue.put(row, timeout=QUEUE_PUT_TIMEOUT)
+            except Full:
+                self.logger.error("[{}] Write queue full. Dropping reading: {}".format(
+                                    source_id, row['content']))
+                return False
+
+        return True
+
+    def add_raw_reading(self, row):
+        row = dict(row, session_id=self.session_id)
+
+        try:
+            self.row_queue.put(row, timeout=QUEUE_PUT_TIMEOUT)
+        except Full:
+            self.logger.error("[{}] Write queue full. Dropping raw sample".format(
+                                row['source_id']))
+            return False
+
+        return True
+
+    def run(self):
+        db = DryadDatabase()
+
+        rows = []
+        is_running = True
+        flush_time = time() + self.flush_interval
+
+        while is_running:
+            try:
+                row = self.row_queue.get(timeout=max(flush_time - time(), 0.0))
+                if row == None:
+                    is_running = False
+                else:
+                    rows.append(row)
+
+            except Empty:
+                pass
+
+            # Write out the pending rows once we have a full batch, the
+            #   flush interval lapses, or we are asked to stop
+            if (len(rows) >= self.batch_size) or \
+               (time() >= flush_time) or \
+               (is_running == False):
+                self.flush_rows(db, rows)
+
+                rows = []
+                flush_time = time() + self.flush_interval
+
+        # Make the remaining attempts for any rows that still failed
+        while self.flush_rows(db, []) == False:
+            pass
+
+        db.close_session()
+        remove_session()
+
+        return
+
+    def flush_rows(self, db, rows):
+        # Raw samples go into their own table. Each table is written
+        #   separately so that a failure in one does not hold back the other
+        data_rows = [ row for row in rows if 'raw' not in row ]
+        raw_rows = [ row for row in rows if 'raw' in row ]
+
+        result = self.write_rows(db.add_session_data_bulk, 'readings', data_rows)
+        if self.write_rows(db.add_raw_data_bulk, 'raw samples', raw_rows) == False:
+            result = False
+
+        return result
+
+    # @desc     Writes rows along with those of the same kind that failed to
+    #           be written before. Failed rows are kept for the next flush
+    #           and are only dropped after MAX_FLUSH_ATTEMPTS failed flushes
+    # @return   True if there are no failed rows left, otherwise False
+    def write_rows(self, func_add_bulk, kind, rows):
+        rows = self.failed_rows[kind] + rows
+        if len(rows) <= 0:
+            return True
+
+        if func_add_bulk(rows) == True:
+            self.logger.debug("Wrote {} {}".format(len(rows), kind))
+            self.failed_rows[kind] = []
+            self.failed_flushes[kind] = 0
+            return True
+
+        self.failed_flushes[kind] += 1
+        if self.failed_flushes[kind] >= MAX_FLUSH_ATTEMPTS:
+            self.logger.error("Failed to write {} {} after {} attempts. Dropping them".format(
+                                len(rows), kind, self.failed_flushes[kind]))
+            self.failed_rows[kind] = []
+            self.failed_flushes[kind] = 0
+            return True
+
+        self.logger.warning("Failed to write {} {}. Retrying on the next flush".format(
+                                len(rows), kind))
+        self.failed_rows[kind] = rows
+
+        return False
+
+    def stop(self):
+        # Flush all pending rows and wait for the thread to finish
+        self.row_queue.put(None)
+        self.join()
+
+        return
+
@@ -0,0 +1,134 @@
+#
+#   Data Records
+#   Author: Francis T
+#
+#   Formats stored data blocks and raw samples into the records handed out
+#   to clients
+#
+import json
+
+from utils.transform import calibrate_raw, unpack_values
+from utils.calibration import calibrate_raw_bulk
+
+DOWNLOAD_CHUNK_SIZE = 50
+
+# @desc     Formats a data block as a client record
+# @return   A dict holding the record
+def build_data_record(reading, schemas):
+    data_block = {}
+    data_block['rec_id'] = reading.id
+    data_block['timestamp'] = reading.end_time
+    data_block['sampling_site'] = reading.site_name # TODO
+
+    # Blocks stored before packed values were introduced only have
+    #   their stringified contents
+    if reading.schema_id in schemas:
+        data_block['data'] = dict(zip(schemas[reading.schema_id],
+                                      unpack_values(reading.packed_values)))
+    else:
+        data_block['data'] = json.loads(reading.content.replace("'",'"'))
+    data_block['origin'] = { 'name' : reading.name,
+                             'lat'  : reading.lat,
+                             'lon'  : reading.lon,
+                             'addr' : "---" }
+
+
+    if 'ph' not in data_block['data']:
+        data_block['data']['ph'] = None
+
+    if 'bl_batt' not in data_block['data']:
+        data_block['data']['bl_batt'] = None
+
+    return data_block
+
+# @desc     Formats a raw sample as a client record, calibrating it on the
+#           way unless its calibrated values are given
+# @return   A dict holding the record
+def build_raw_record(reading, data=None):
+    if data == None:
+        data = calibrate_raw(reading.sensor, reading.raw, reading.cal_version)
+
+    data_block = {}
+    data_block['rec_id'] = reading.id
+    data_block['timestamp'] = reading.timestamp
+    data_block['sampling_site'] = reading.site_name
+    data_block['data'] = data
+    data_block['cal_version'] = reading.cal_version
+    data_block['origin'] = { 'name' : reading.name,
+                             'lat'  : reading.lat,
+                             'lon'  : reading.lon,
+                             'addr' : "---" }
+
+    if 'ph' not in data_block['data']:
+        data_block['data']['ph'] = None
+
+    if 'bl_batt' not in data_block['data']:
+        data_block['data']['bl_batt'] = None
+
+    return data_block
+
+# @desc     Formats raw samples as client records, calibrating the samples
+#           of each sensor type and calibration version together
+# @return   A list of dicts holding the records
+def build_raw_records(readings):
+    groups = {}
+    for idx, reading in enumerate(readings):
+        groups.setdefault((reading.sensor, reading.cal_version), []).append(idx)
+
+    calibrated = [ None ] * len(readings)
+    for (sensor, cal_version), indices in groups.items():
+        samples = [ readings[idx].raw for idx in indices ]
+        for idx, data in zip(indices, calibrate_raw_bulk(sensor, samples, cal_version)):
+            calibrated[idx] = data
+
+    return [ build_raw_record(reading, data) for reading, data in zip(readings, calibrated) ]
+
+# @desc     Reads the matching data blocks (or raw samples) in chunks so that
+#           they never have to be held in memory all at once
+# @return   A generator of record lists, in record id order
+def iter_records(db, limit=None, offset=None, start_id=0,
+                 end_id=100000000000000, after_id=None, is_raw=False,
+                 chunk_size=DOWNLOAD_CHUNK_SIZE):
+
+    # Raw samples are calibrated only as they are sent out
+    schemas = db.get_sensor_schemas()
+    func_get_data = db.get_data
+    func_build_records = lambda readings: [ build_data_record(reading, schemas)
+                                            for reading in readings ]
+    if is_raw:
+        func_get_data = db.get_raw_data
+        func_build_records = build_raw_records
+
+    last_id = after_id
+    records_left = limit
+
+    while True:
+        fetch_size = chunk_size
+        if records_left != None:
+            fetch_size = min(fetch_size, records_left)
+
+        if fetch_size <= 0:
+            break
+
+        matched_data = func_get_data(limit=fetch_size,
+                                     offset=offset,
+                                     start_id=start_id,
+                                     end_id=end_id,
+                                     after_id=last_id)
+        if (matched_data == False) or (len(matched_data) <= 0):
+            break
+
+        yield func_build_records(matched_data)
+
+        # Any offset only applies to the first chunk
+        offset = None
+        last_id = matched_data[-1].id
+
+        if records_left != None:
+            records_left -= len(matched_data)
+
+        if len(matched_data) < fetch_size:
+            break
+
+    return
+
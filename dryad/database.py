@@ -1,30 +1,275 @@
 import logging
 import time
+import json
+import os
 
 from collections import Iterable
-from sqlalchemy import create_engine, event, and_
-from sqlalchemy.orm import sessionmaker
+from threading import Lock
+from sqlalchemy import create_engine, event, inspect, func, and_, or_, bindparam
+from sqlalchemy.orm import sessionmaker, scoped_session
 
 from dryad.models import Base, NodeData, NodeEvent, SystemInfo
 from dryad.models import Node, SystemParam, NodeDevice, Session
-from dryad.models import SessionData
+from dryad.models import SessionData, NodeLinkStats, NodeGattHandles, RawData
+from dryad.models import SensorSchema, SyncCursor
+from utils.transform import pack_values, can_pack_values
 
 
 DEFAULT_DB_NAME = "sqlite:///dryad_cache.db"
+DEFAULT_CHUNK_SIZE = 500
+SCHEMA_VERSION = 1          # Stored in the database as its user_version
+LINK_STATS_WEIGHT = 0.3     # Weight given to the latest collection cycle
+SYNC_STREAM_DATA = "DATA"   # Sync cursor over the data blocks
+SYNC_STREAM_RAW = "RAW"     # Sync cursor over the raw samples
+DATA_CHANGE_COUNT = "DATA_CHANGE_COUNT"     # System info entry
 module_logger = logging.getLogger("main.database")
 
+# Shared engines and session registries, keyed by database URL
+db_registries = {}
+db_registries_lock = Lock()
 
-class DryadDatabase:
-    def __init__(self, db_name=DEFAULT_DB_NAME):
+
+# Required in order to add foreign keys constraints
+def on_connect(conn, record):
+    conn.execute('pragma foreign_keys=ON')
+
+
+class DatabaseRegistry:
+    def __init__(self, db_name):
+        self.db_name = db_name
         self.engine = create_engine(db_name)
+        self.is_bootstrapped = False
+
+        event.listen(self.engine, 'connect', on_connect)
+
+        # Sessions are handed out per thread from a single registry
+        self.session_factory = sessionmaker(bind=self.engine)
+        self.sessions = scoped_session(self.session_factory)
+
+        # Sensor schema ids, keyed by their comma-separated data keys
+        self.schema_ids = {}
+        self.schema_ids_lock = Lock()
+
+        return
+
+    # @desc     Creates any missing tables, then upgrades databases made by
+    #           older versions of the schema: adds missing columns and
+    #           indexes and migrates data stored in older formats. The
+    #           upgrade is done once, after which the schema version is
+    #           recorded in the database. Later calls on the same registry
+    #           do nothing
+    # @return   True if successful, otherwise False
+    def bootstrap(self):
+        if self.is_bootstrapped:
+            return True
+
+        try:
+            Base.metadata.create_all(self.engine)
+
+            if self.get_schema_version() < SCHEMA_VERSION:
+                self.create_missing_columns()
+                self.create_missing_indexes()
+                self.migrate_node_data()
+                self.set_schema_version(SCHEMA_VERSION)
+
+        except Exception as e:
+            module_logger.error("Failed to bootstrap {}: {}".format(self.db_name, e))
+            return False
+
+        self.is_bootstrapped = True
+        return True
+
+    def get_schema_version(self):
+        return self.engine.execute("PRAGMA user_version").scalar()
+
+    def set_schema_version(self, version):
+        self.engine.execute("PRAGMA user_version = {}".format(int(version)))
+        return
+
+    # @desc     Adds declared columns that are missing from tables created
+    #           by older versions of the schema
+    # @return   None
+    def create_missing_columns(self):
+        inspector = inspect(self.engine)
+
+        for table in Base.metadata.sorted_tables:
+            existing = [ column['name'] for column in inspector.get_columns(table.name) ]
+
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+
+                module_logger.info("Adding column {} to {}".format(column.name, table.name))
+                self.engine.execute("ALTER TABLE {} ADD COLUMN {} {}".format(
+                                        table.name, column.name,
+                                        column.type.compile(dialect=self.engine.dialect)))
+
+        return
+
+    # @desc     Adds declared indexes that are missing from tables created
+    #           by older versions of the schema
+    # @return   None
+    def create_missing_indexes(self):
+        inspector = inspect(self.engine)
 
-        event.listen(self.engine, 'connect', self.on_connect)
-        DBSession = sessionmaker(bind=self.engine)
-        Base.metadata.create_all(self.engine)
+        for table in Base.metadata.sorted_tables:
+            existing = [ index['name'] for index in inspector.get_indexes(table.name) ]
 
-        # Current db session
-        self.db_session = DBSession()
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
 
+                module_logger.info("Creating index {} on {}".format(index.name, table.name))
+                index.create(self.engine)
+
+        return
+
+
+    # @desc     Converts data blocks stored as stringified dicts into packed
+    #           values with a sensor schema. Blocks with values that cannot
+    #           be packed without loss keep their stringified contents
+    # @return   The number of data blocks converted
+    def migrate_node_data(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        session = self.session_factory()
+
+        last_id = 0
+        migrated = 0
+        kept = 0
+        try:
+            while True:
+                chunk = session.query(NodeData.id, NodeData.content)\
+                               .filter(NodeData.schema_id == None)\
+                               .filter(NodeData.content != None)\
+                               .filter(NodeData.id > last_id)\
+                               .order_by(NodeData.id)\
+                               .limit(chunk_size)\
+                               .all()
+
+                updates = []
+                for record in chunk:
+                    try:
+                        content = json.loads(record.content.replace("'", '"'))
+                    except ValueError:
+                        module_logger.error("Cannot migrate data block {}".format(record.id))
+                        continue
+
+                    if not can_pack_values(content.values()):
+                        kept += 1
+                        continue
+
+                    schema_id, packed_values = self.pack_content(session, content)
+                    updates.append( { 'row_id'        : record.id,
+                                      'schema_id'     : schema_id,
+                                      'packed_values' : packed_values } )
+
+                # Update the table directly since the model does not allow
+                #   clearing the content
+                if len(updates) > 0:
+                    table = NodeData.__table__
+                    session.execute(table.update()\
+                                         .where(table.c.id == bindparam('row_id'))\
+                                         .values(schema_id=bindparam('schema_id'),
+                                                 packed_values=bindparam('packed_values'),
+                                                 content=None),
+                                    updates)
+                    session.commit()
+                    migrated += len(updates)
+
+                if len(chunk) < chunk_size:
+                    break
+
+                last_id = chunk[-1].id
+
+        except Exception:
+            session.rollback()
+            raise
+
+        finally:
+            session.close()
+
+        if migrated > 0:
+            module_logger.info("Migrated {} data blocks".format(migrated))
+
+        if kept > 0:
+            module_logger.info("Kept {} data blocks with unpackable values".format(kept))
+
+        return migrated
+
+    # @desc     Packs the contents of a data block, adding a sensor schema
+    #           for its keys if there is none yet
+    # @return   A tuple of the schema id and the packed values
+    def pack_content(self, session, content):
+        keys = sorted(content.keys())
+        schema_id = self.get_schema_id(session, keys)
+
+        return schema_id, pack_values([ content[key] for key in keys ])
+
+    def get_schema_id(self, session, keys):
+        schema_keys = ",".join(keys)
+
+        self.schema_ids_lock.acquire()
+        try:
+            if schema_keys not in self.schema_ids:
+                schema = session.query(SensorSchema).filter_by(keys=schema_keys).first()
+                if schema is None:
+                    schema = SensorSchema(keys=schema_keys)
+                    session.add(schema)
+                    session.commit()
+
+                self.schema_ids[schema_keys] = schema.id
+
+            schema_id = self.schema_ids[schema_keys]
+        finally:
+            self.schema_ids_lock.release()
+
+        return schema_id
+
+
+# @desc     Gets the shared engine and session registry for a database,
+#           creating it on first use
+# @return   A DatabaseRegistry object
+def get_registry(db_name=DEFAULT_DB_NAME):
+    db_registries_lock.acquire()
+    try:
+        registry = db_registries.get(db_name)
+        if registry is None:
+            registry = DatabaseRegistry(db_name)
+            db_registries[db_name] = registry
+    finally:
+        db_registries_lock.release()
+
+    return registry
+
+# @desc     Discards the db session of the calling thread. Meant to be called
+#           only as a thread finishes, since the session is shared with all
+#           DryadDatabase instances in the thread
+# @return   None
+def remove_session(db_name=DEFAULT_DB_NAME):
+    get_registry(db_name).sessions.remove()
+    return
+
+# @desc     Sets up the database schema. Only the Aggregator Node program
+#           calls this, once at startup, so that other processes sharing
+#           the database (such as the web server) never race it on
+#           schema changes
+# @return   True if successful, otherwise False
+def init_database(db_name=DEFAULT_DB_NAME):
+    return get_registry(db_name).bootstrap()
+
+
+class DryadDatabase:
+    def __init__(self, db_name=DEFAULT_DB_NAME):
+        self.registry = get_registry(db_name)
+        self.engine = self.registry.engine
+
+        # Current db session (shared with other DryadDatabase
+        #   instances within the same thread)
+        self.db_session = self.registry.sessions()
+
+    # @desc     Closes the db session of the calling thread. The session is
+    #           shared with other DryadDatabase instances in the same thread,
+    #           which can keep on using it afterwards
+    # @return   True if successful, otherwise False
     def close_session(self):
         try:
             self.db_session.close()
@@ -33,10 +278,6 @@ class DryadDatabase:
             return False
         return True
 
-    # Required in order to add foreign keys constraints
-    def on_connect(self, conn, record):
-        conn.execute('pragma foreign_keys=ON')
-
     # Executes each test case
     def tearDown(self):
         Base.metadata.drop_all(self.engine)
@@ -55,6 +296,71 @@ class DryadDatabase:
             return False
         return True
 
+    # @desc     Adds several records to a table using a single executemany
+    #           within one transaction. Records may either be dicts of
+    #           column values or instances of the table's model class
+    # @return   True if the whole batch was added, otherwise False
+    def add_bulk(self, model, records):
+        rows = [ self.to_row(model, record) for record in records ]
+
+        if len(rows) <= 0:
+            return True
+
+        try:
+            self.db_session.execute(model.__table__.insert(), rows)
+            self.db_session.commit()
+        except Exception as e:
+            print(e)
+            self.db_session.rollback()
+            module_logger.error("Failed to add batch of {} records to {}".format(
+                                    len(rows), model.__tablename__))
+            return False
+
+        module_logger.debug("Added batch of {} records to {}".format(
+                                len(rows), model.__tablename__))
+        return True
+
+    # @desc     Same as add_bulk() for models tied to a session, filling in
+    #           the current session wherever session_id is missing
+    # @return   True if successful, otherwise False
+    def add_session_bulk(self, model, records):
+        session = None
+
+        rows = []
+        for record in records:
+            record = self.to_row(model, record)
+
+            if record.get('session_id') is None:
+                # Look up the current session only once per batch
+                if session is None:
+                    session = self.get_current_session()
+                    if session == False:
+                        return False
+
+                record = dict(record, session_id=session.id)
+
+            rows.append(record)
+
+        return self.add_bulk(model, rows)
+
+    # @desc     Converts a model instance into a dict of its column values
+    # @return   A dict of column values
+    def to_row(self, model, record):
+        if not isinstance(record, model):
+            return record
+
+        row = {}
+        for column in model.__table__.columns:
+            value = getattr(record, column.name)
+
+            # Let the database assign any missing primary keys
+            if (value is None) and column.primary_key:
+                continue
+
+            row[column.name] = value
+
+        return row
+
     # @desc     Inserts if record non-existing, update if otherwise
     # @return   True if successful, otherwise False
     def insert_or_update(self, obj):
@@ -217,6 +523,80 @@ class DryadDatabase:
 
         return result
 
+    ##********************************##
+    ##          GATT Handles          ##
+    ##******************************* ##
+    def insert_or_update_gatt_handles(self, address, firmware, handles):
+        gatt_handles = NodeGattHandles(address=address, firmware=firmware,
+                                       handles=handles)
+        return self.insert_or_update(gatt_handles)
+
+    def get_gatt_handles(self, address, firmware=None):
+        target = self.db_session.query(NodeGattHandles).filter_by(address=address)
+
+        if firmware is not None:
+            target = target.filter_by(firmware=firmware)
+
+        return self.get(address, target.all())
+
+    ##********************************##
+    ##         Link Statistics        ##
+    ##******************************* ##
+    def get_node_link_stats(self, address=None):
+        if address is not None:
+            result = self.db_session.query(
+                NodeLinkStats).filter_by(address=address).first()
+        else:
+            result = self.db_session.query(
+                NodeLinkStats).all()
+
+        return self.get(address, result)
+
+    # @desc     Folds the outcome of a collection cycle into the connection
+    #           quality history of a device. Rates and durations are kept
+    #           as moving averages so that recent cycles count the most
+    # @return   True if successful, otherwise False
+    def update_node_link_stats(self, address, node_id, attempts, connected,
+                               connect_time=None, read_duration=None):
+        stats = self.db_session.query(
+            NodeLinkStats).filter_by(address=address).first()
+
+        if stats is None:
+            stats = NodeLinkStats(address=address,
+                                  node_id=node_id,
+                                  connect_attempts=0,
+                                  connect_successes=0,
+                                  consecutive_failures=0)
+
+        stats.node_id = node_id
+        stats.connect_attempts += attempts
+
+        outcome = 1.0 if connected else 0.0
+        stats.success_rate = self.moving_average(stats.success_rate, outcome)
+
+        if connected:
+            stats.connect_successes += 1
+            stats.consecutive_failures = 0
+            stats.last_success = int(time.time())
+        else:
+            stats.consecutive_failures += 1
+
+        if connect_time is not None:
+            stats.avg_connect_time = self.moving_average(stats.avg_connect_time,
+                                                         connect_time)
+
+        if read_duration is not None:
+            stats.avg_read_duration = self.moving_average(stats.avg_read_duration,
+                                                          read_duration)
+
+        return self.insert_or_update(stats)
+
+    def moving_average(self, average, value):
+        if average is None:
+            return value
+
+        return (LINK_STATS_WEIGHT * value) + ((1.0 - LINK_STATS_WEIGHT) * average)
+
     ##********************************##
     ##           Session              ##
     ##******************************* ##
@@ -234,7 +614,7 @@ class DryadDatabase:
             return False
         return result
 
-    def get_sessions(self, record_offset=0, record_limit=3):
+    def get_sessions(self, record_offset=0, record_limit=3, after_id=None):
         result = []
         try:
             session_query = self.db_session.query(Session)\
@@ -242,6 +622,13 @@ class DryadDatabase:
                                 .limit(record_limit)\
                                 .offset(record_offset)
 
+            # Paging by session id goes from the oldest session onwards
+            if after_id is not None:
+                session_query = self.db_session.query(Session)\
+                                    .filter(Session.id > after_id)\
+                                    .order_by(Session.id)\
+                                    .limit(record_limit)
+
             result = self.get("session_id", session_query)
 
         except Exception as e:
@@ -262,23 +649,53 @@ class DryadDatabase:
     ##              Data              ##
     ##******************************* ##
     def get_data(self, id=None, session_id=None, limit=None, offset=None,
-                 start_id=0, end_id=100000000000000):
+                 start_id=0, end_id=100000000000000, after_id=None):
 
         result = self.db_session.query(NodeData.id, Node.name,
                                        Session.end_time, NodeData.content,
+                                       NodeData.schema_id, NodeData.packed_values,
                                        Node.lat, Node.lon, Node.site_name)\
             .join(Session).join(Node, NodeData.source_id == Node.name).filter(
-                and_(NodeData.id >= start_id, NodeData.id <= end_id)).order_by(
-                NodeData.id)
+                and_(NodeData.id >= start_id, NodeData.id <= end_id))
+
+        # Resume right after the last record of a previous page
+        if after_id is not None:
+            result = result.filter(NodeData.id > after_id)
+
+        result = result.order_by(NodeData.id)
 
         if offset is not None:
-            result = result[offset:]
+            result = result.offset(offset)
 
         if limit is not None:
-            result = result[:limit]
+            result = result.limit(limit)
 
         return self.get("data", result)
 
+    # @desc     Converts the contents of a data block into the columns used
+    #           to store it
+    # @return   A dict with the schema id and the packed values, or with the
+    #           stringified contents if some value cannot be packed
+    def pack_data_content(self, content):
+        if not can_pack_values(content.values()):
+            return { 'schema_id'     : None,
+                     'packed_values' : None,
+                     'content'       : str(content) }
+
+        schema_id, packed_values = self.registry.pack_content(self.db_session, content)
+
+        return { 'schema_id'     : schema_id,
+                 'packed_values' : packed_values }
+
+    # @desc     Gets the keys of all sensor schemas
+    # @return   A dict of key lists, keyed by schema id
+    def get_sensor_schemas(self):
+        schemas = {}
+        for schema in self.db_session.query(SensorSchema).all():
+            schemas[schema.id] = schema.keys.split(",")
+
+        return schemas
+
     def add_data(self, blk_id, session_id, source_id, content, timestamp):
         data = NodeData(blk_id=blk_id,
                         session_id=session_id,
@@ -286,6 +703,78 @@ class DryadDatabase:
                         content=content, timestamp=timestamp)
         return self.add(data)
 
+    # @desc     Counts the data blocks without loading them
+    # @return   The number of data blocks
+    def count_data(self):
+        return self.db_session.query(func.count(NodeData.id)).scalar()
+
+    # @desc     Gets the highest id of the stored data blocks (or raw samples)
+    # @return   The record id, or 0 if there are no records yet
+    def get_last_data_id(self, is_raw=False):
+        model = RawData if is_raw else NodeData
+        last_id = self.db_session.query(func.max(model.id)).scalar()
+        if last_id is None:
+            return 0
+
+        return last_id
+
+    # @desc     Gets figures which change whenever the data records handed
+    #           out to clients would change, without scanning the data
+    #           tables. Records are only ever appended, so the highest
+    #           record id covers new ones, while changes made in place
+    #           (such as recalibrating raw samples) bump a change count.
+    #           Records also carry their node's site and location and take
+    #           their timestamp from their session's end time, so the node
+    #           rows and the latest session are included as well
+    # @return   A list of the figures
+    def get_data_version(self, is_raw=False):
+        model = RawData if is_raw else NodeData
+        version = [ self.db_session.query(func.max(model.id)).scalar(),
+                    self.get_data_change_count() ]
+
+        nodes = self.db_session.query(Node.name, Node.site_name,
+                                      Node.lat, Node.lon)\
+                    .order_by(Node.name).all()
+        version.append([ list(node) for node in nodes ])
+
+        session = self.db_session.query(Session.id, Session.end_time)\
+                        .order_by(Session.id.desc()).first()
+        if session is not None:
+            version.extend(session)
+
+        return version
+
+    # @desc     Gets the number of times stored records were changed in place
+    # @return   The change count
+    def get_data_change_count(self):
+        count = self.db_session.query(SystemInfo.value)\
+                    .filter_by(name=DATA_CHANGE_COUNT).scalar()
+        if count is None:
+            return 0
+
+        return int(count)
+
+    # @desc     Gets summary figures for the data stored in the database
+    # @return   A dict with the data block count, the pending session data
+    #           count and the size of the database file in bytes
+    def get_data_stats(self):
+        stats = {
+            'records' : self.count_data(),
+            'pending' : self.count_session_data(),
+            'db_size' : 0,
+        }
+
+        db_path = self.engine.url.database
+        if db_path and os.path.exists(db_path):
+            stats['db_size'] = os.path.getsize(db_path)
+
+        return stats
+
+    # @desc     Adds several data blocks in a single transaction
+    # @return   True if successful, otherwise False
+    def add_data_bulk(self, records):
+        return self.add_bulk(NodeData, records)
+
     ##********************************##
     ##           Session Data         ##
     ##******************************* ##
@@ -308,6 +797,41 @@ class DryadDatabase:
             result = result[:limit]
         return self.get("data", result)
 
+    # @desc     Iterates over all session data ordered by source id, loading
+    #           the records from the database in chunks
+    # @return   A generator of session data records
+    def iter_session_data(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        last_source_id = None
+        last_id = None
+
+        while True:
+            query = self.db_session.query(SessionData.id,
+                                          SessionData.session_id,
+                                          SessionData.source_id,
+                                          SessionData.content,
+                                          SessionData.timestamp)
+
+            # Resume right after the last record of the previous chunk
+            if last_id is not None:
+                query = query.filter(or_(SessionData.source_id > last_source_id,
+                                         and_(SessionData.source_id == last_source_id,
+                                              SessionData.id > last_id)))
+
+            chunk = query.order_by(SessionData.source_id, SessionData.id)\
+                         .limit(chunk_size)\
+                         .all()
+
+            for record in chunk:
+                yield record
+
+            if len(chunk) < chunk_size:
+                break
+
+            last_source_id = chunk[-1].source_id
+            last_id = chunk[-1].id
+
+        return
+
     def add_session_data(self, source_id, content, timestamp):
         data = SessionData(session_id=self.get_current_session().id, 
                            source_id=source_id,
@@ -315,6 +839,18 @@ class DryadDatabase:
                            timestamp=timestamp)
         return self.add(data)
 
+    # @desc     Adds several session data records in a single transaction.
+    #           Records without a session id are assigned to the current
+    #           session
+    # @return   True if successful, otherwise False
+    def add_session_data_bulk(self, records):
+        return self.add_session_bulk(SessionData, records)
+
+    # @desc     Counts the session data awaiting offload
+    # @return   The number of session data records
+    def count_session_data(self):
+        return self.db_session.query(func.count(SessionData.id)).scalar()
+
     def clear_session_data(self):
         self.db_session.query(SessionData).delete()
         self.db_session.commit()
@@ -322,6 +858,93 @@ class DryadDatabase:
         return True
 
 
+    ##********************************##
+    ##            Raw Data            ##
+    ##******************************* ##
+    def get_raw_data(self, limit=None, offset=None, start_id=0,
+                     end_id=100000000000000, after_id=None):
+
+        result = self.db_session.query(RawData.id, Node.name,
+                                       RawData.timestamp, RawData.sensor,
+                                       RawData.cal_version, RawData.raw,
+                                       Node.lat, Node.lon, Node.site_name)\
+            .join(Node, RawData.source_id == Node.name).filter(
+                and_(RawData.id >= start_id, RawData.id <= end_id))
+
+        # Resume right after the last record of a previous page
+        if after_id is not None:
+            result = result.filter(RawData.id > after_id)
+
+        result = result.order_by(RawData.id)
+
+        if offset is not None:
+            result = result.offset(offset)
+
+        if limit is not None:
+            result = result.limit(limit)
+
+        return self.get("data", result)
+
+    # @desc     Adds several raw samples in a single transaction. Records
+    #           without a session id are assigned to the current session
+    # @return   True if successful, otherwise False
+    def add_raw_data_bulk(self, records):
+        return self.add_session_bulk(RawData, records)
+
+    # @desc     Switches raw samples over to another calibration version,
+    #           which is applied the next time they are exported
+    # @return   True if successful, otherwise False
+    def update_raw_data_calibration(self, cal_version, source_id=None):
+        try:
+            query = self.db_session.query(RawData)
+            if source_id is not None:
+                query = query.filter_by(source_id=source_id)
+
+            query.update({ RawData.cal_version : cal_version },
+                         synchronize_session=False)
+
+            # Let clients know that records they hold may have changed
+            self.db_session.merge(SystemInfo(name=DATA_CHANGE_COUNT,
+                                             value=str(self.get_data_change_count() + 1)))
+            self.db_session.commit()
+        except Exception as e:
+            print(e)
+            self.db_session.rollback()
+            return False
+
+        return True
+
+    ##********************************##
+    ##          Sync Cursors          ##
+    ##******************************* ##
+    # @desc     Gets the id of the last record acknowledged by a client
+    # @return   The record id, or 0 if the client has not synced before
+    def get_sync_acked_id(self, client_id, stream=SYNC_STREAM_DATA):
+        cursor = self.db_session.query(SyncCursor)\
+                    .filter_by(client_id=client_id, stream=stream).first()
+        if cursor is None:
+            return 0
+
+        return cursor.acked_id
+
+    # @desc     Moves the sync cursor of a client up to an acknowledged
+    #           record. The cursor never moves back unless it is reset
+    # @return   True if successful, otherwise False
+    def update_sync_cursor(self, client_id, acked_id, stream=SYNC_STREAM_DATA,
+                           reset=False):
+        cursor = self.db_session.query(SyncCursor)\
+                    .filter_by(client_id=client_id, stream=stream).first()
+
+        if cursor is None:
+            cursor = SyncCursor(client_id=client_id, stream=stream, acked_id=0)
+
+        if reset or (acked_id > cursor.acked_id):
+            cursor.acked_id = acked_id
+
+        cursor.updated_time = int(time.time())
+
+        return self.insert_or_update(cursor)
+
     ##********************************##
     ##             Event              ##
     ##******************************* ##
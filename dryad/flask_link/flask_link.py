@@ -6,15 +6,21 @@
 """
 import socket
 import json
+import logging
+
+from threading import Lock
 
 HOST = ''                 # The remote host
 PORT = 50007              # The same port as used by the server
 
+RECEIVE_LEN  = 2056
+SEND_TIMEOUT = 30.0
+
+module_logger = logging.getLogger("main.flask_link")
+
 class FlaskLink():
     def __init__(self):
         self.server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.client_sock = None
-        self.connected = False
         return
 
     def init_socket(self, timeout=180.0):
@@ -30,82 +36,96 @@ class FlaskLink():
         self.server_sock.settimeout(timeout)
         return True
 
-    def is_connected(self):
-        return self.connected
-
-    def listen(self):
+    def accept(self):
         try:
-            self.client_sock, client_info = self.server_sock.accept()
+            client_sock, client_info = self.server_sock.accept()
         except Exception as e:
-            print("Exception occurred at listen: " + str(e))
-            return False
+            module_logger.error("Exception occurred at listen: {}".format(str(e)))
+            return None
 
         if client_info == None:
-            return False
+            return None
+
+        module_logger.debug("Connection accepted from {}".format(str(client_info)))
+        return FlaskClientLink(client_sock, client_info)
 
-        print("Connection accepted from " + str(client_info))
+    def fileno(self):
+        return self.server_sock.fileno()
+
+    def destroy(self):
+        self.server_sock.close()
+        return
+
+class FlaskClientLink():
+    def __init__(self, client_sock, client_info, timeout=SEND_TIMEOUT):
+        self.client_sock = client_sock
+        self.client_info = client_info
         self.connected = True
-        return True
+
+        # Only one response may be sent over the link at a time
+        self.send_lock = Lock()
+
+        # Receives are only done once the socket is known to be readable,
+        #   while sends may block until this timeout lapses
+        self.client_sock.settimeout(timeout)
+
+        # Responses are sent in pieces, so send them out right away
+        self.client_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return
+
+    def is_connected(self):
+        return self.connected
 
     def receive_data(self):
         if self.connected == False:
-            print("Not connected")
+            module_logger.debug("Not connected")
             return False
 
-        if self.client_sock == None:
-            print("No clients to receive data from")
-            return None
-
         try:
-            data = self.client_sock.recv(2056)
+            data = self.client_sock.recv(RECEIVE_LEN)
         except Exception as e:
-            print("Exception occured during receive: " + str(e))
+            module_logger.error("Exception occured during receive: {}".format(str(e)))
             self.connected = False
             return None
 
         if not data:
             return None
 
-        if data == b'':
-            return None
-
-        print("Data received [%s]" % data)
+        # Payloads are only formatted when debug logging is enabled
+        module_logger.debug("Data received [%s]", data)
 
         return data
 
     def send_response(self, resp_data):
         if self.connected == False:
-            print("Not connected")
+            module_logger.debug("Not connected")
             return False
 
-        if self.client_sock == None:
-            print("No clients to respond to")
-            return False
+        # Binary responses are sent as they are
+        if isinstance(resp_data, str):
+            resp_data = resp_data.encode('UTF-8')
 
-        print("Sending response...")
+        module_logger.debug("Sending response...")
+        self.send_lock.acquire()
         try:
-            self.client_sock.sendall(resp_data.encode('UTF-8'))
+            self.client_sock.sendall(resp_data)
         except Exception as e:
-            print("Send failed: {}".format(str(e)))
+            module_logger.error("Send failed: {}".format(str(e)))
             self.connected = False
             return False
+        finally:
+            self.send_lock.release()
 
-        print("RESPONSE [%s]" % resp_data)
+        module_logger.debug("RESPONSE [%s]", resp_data)
 
         return True
 
     def disconnect(self):
-        if self.client_sock == None:
-            print("No clients to disconnect from")
-            return False
-
         self.client_sock.close()
         self.connected = False
         return True
 
-    def destroy(self):
-        self.server_sock.close()
-        self.connected = False
-        return
+    def fileno(self):
+        return self.client_sock.fileno()
 
 
@@ -1,16 +1,33 @@
 """
     Name: flask_listener.py
     Author: Francis T
-    Desc: Source code for FlaskListenerThread to be used by the multithreaded 
+    Desc: Source code for FlaskListenerThread to be used by the multithreaded
           version of the Dryad Cache Node program
 """
 import logging
+import selectors
 import time
 
-from queue import Queue
-from threading import Thread, Event
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Lock
 
 from dryad.flask_link.flask_link import FlaskLink
+from dryad.message_framer import MessageFramer
+
+class FlaskConnection():
+    """ State kept for each connected client """
+    def __init__(self, link, framer):
+        self.link = link
+        self.framer = framer
+        self.last_active_time = time.time()
+
+        # Requests waiting to be handled, in the order they were received
+        self.pending = deque()
+        self.is_busy = False
+        self.is_closed = False
+        self.lock = Lock()
+        return
 
 class FlaskListenerThread(Thread):
 
@@ -18,13 +35,17 @@ class FlaskListenerThread(Thread):
     def __init__(self, request_handler):
         self.SOCKET_TIMEOUT  = 5.0
         self.IDLE_TIMEOUT    = 120.0
-        self.RECEIVE_TIMEOUT = self.SOCKET_TIMEOUT * 5.0
+        self.SELECT_TIMEOUT  = 1.0
         self.MAX_RECEIVE_LEN = 2048
+        self.MAX_WORKERS     = 4
         self.MSG_TERMS = [ '\n', '\r', ';', '\0' ]
         self.MSG_SEP = ','
 
         self.request_hdl = request_handler
         self.link = None
+        self.selector = None
+        self.workers = None
+        self.connections = {}
         self.is_running = False
         self.logger = logging.getLogger("main.dryad.FlaskListenerThread")
         Thread.__init__(self)
@@ -36,7 +57,7 @@ class FlaskListenerThread(Thread):
         self.is_running = False
         return
 
-    """ Sets up a link to the Mobile Node """
+    """ Sets up the listening socket for Flask clients """
     def setup_link(self):
         self.link = FlaskLink()
         if self.link.init_socket(self.SOCKET_TIMEOUT) == False:
@@ -53,105 +74,144 @@ class FlaskListenerThread(Thread):
         self.link.destroy()
         return True
 
-    """ Attempts to receive data from the remote device """
-    def receive_data(self):
-        if self.link.is_connected() == False:
-            self.logger.error("Not connected")
+    """ Accepts a new client connection """
+    def accept_connection(self):
+        client_link = self.link.accept()
+        if client_link == None:
+            return False
+
+        conn = FlaskConnection(client_link,
+                               MessageFramer(self.MSG_TERMS, self.MAX_RECEIVE_LEN))
+        self.connections[client_link.fileno()] = conn
+        self.selector.register(client_link, selectors.EVENT_READ, conn)
+
+        self.logger.info("Session started.")
+        return True
+
+    """ Closes a client connection once it has no more requests to handle """
+    def close_connection(self, conn):
+        fd = conn.link.fileno()
+        if fd in self.connections:
+            self.selector.unregister(conn.link)
+            del self.connections[fd]
+
+        conn.lock.acquire()
+        conn.is_closed = True
+        is_busy = conn.is_busy
+        conn.lock.release()
+
+        # A busy connection is closed by its worker once it is done
+        if not is_busy:
+            conn.link.disconnect()
+            self.logger.info("Session ended.")
+
+        return
+
+    """ Receives data from a client connection that is ready to be read """
+    def receive_data(self, conn):
+        data_part = conn.link.receive_data()
+
+        # If the data part contains nothing, then the client has closed
+        #   the connection or the connection has failed
+        if (data_part is None) or (data_part == False):
+            self.logger.info("Connection lost")
+            self.close_connection(conn)
             return False
 
-        data_buf = ""
+        conn.last_active_time = time.time()
+
+        # Several requests may arrive in a single packet
+        for msg in conn.framer.feed(data_part):
+            self.queue_request(conn, msg)
+
+        return True
 
-        recv_end_time = time.time() + self.RECEIVE_TIMEOUT
+    """ Hands a request over to the worker pool """
+    def queue_request(self, conn, msg):
+        conn.lock.acquire()
+        conn.pending.append(msg)
 
-        # Keep trying to receive data until we've reached the projected receive
-        #   timeout time OR this thread is no longer running
-        while (time.time() < recv_end_time) and (self.is_running):
-            data_part = self.link.receive_data()
+        # Requests of the same connection are handled one after another
+        #   so that their responses are never interleaved
+        should_submit = not conn.is_busy
+        conn.is_busy = True
+        conn.lock.release()
 
-            if (data_part is not None) or (data_part != None):
-                try:
-                    data_part = data_part.decode("utf-8")
-                except:
-                    self.logger.error("Data not in utf-8 format")
-                    break
+        if should_submit:
+            self.workers.submit(self.handle_requests, conn)
 
-            # If the data part contains nothing, then try to receive data
-            #   again if the thread is still running
-            if (data_part is None) or (data_part == None):
-                self.logger.info("No data received")
-                self.link.connected = False
+        return
+
+    """ Handles all pending requests of a connection """
+    def handle_requests(self, conn):
+        while True:
+            conn.lock.acquire()
+            if len(conn.pending) <= 0:
+                conn.is_busy = False
+                is_closed = conn.is_closed
+                conn.lock.release()
                 break
-   
-            # if data_part == None:
-            #     self.logger.info("No data received")
-            #     if self.link.is_connected() == False:
-            #         break
 
-            #     continue
+            msg = conn.pending.popleft()
+            conn.lock.release()
 
-            # Add this data part to our data buffer
-            data_buf += data_part
+            try:
+                # Process the message
+                self.request_hdl.handle_request(conn.link, msg)
+            except Exception as e:
+                self.logger.exception("Exception occurred: {}".format(str(e)))
 
-            # Also, extend our receive end time by a small bit for every
-            #   successful piece of data received
-            recv_end_time += 1.0
+            conn.last_active_time = time.time()
 
-            # If this data part contains the terminator, then we can return
-            #   the data_buffer's contents to the calling context
-            for terminator in self.MSG_TERMS:
-                if terminator in data_part:
-                    return data_buf
+        if is_closed:
+            conn.link.disconnect()
+            self.logger.info("Session ended.")
 
-            # If we've reached the maximum length of received data, then return
-            #   the current data buffer contents to the calling context
-            if len(data_buf) >= self.MAX_RECEIVE_LEN:
-                return data_buf
+        return
+
+    """ Closes connections which have been idle for too long """
+    def close_idle_connections(self):
+        idle_time = time.time() - self.IDLE_TIMEOUT
+
+        for conn in list(self.connections.values()):
+            conn.lock.acquire()
+            is_busy = conn.is_busy
+            conn.lock.release()
+
+            if is_busy or (conn.last_active_time > idle_time):
+                continue
 
-        self.logger.info("Receive timed out. Returning received content...")
-        return data_buf
+            self.logger.info("Session timed out.")
+            self.close_connection(conn)
+
+        return
 
     """ Run function for this thread """
     def run(self):
         if self.setup_link() == False:
             self.logger.error("Link setup failed")
             return
-    
-        self.is_running = True
-        while self.is_running:
-            # Listen for connections until one has been found; Otherwise, 
-            #   simply return to the beginning of the loop
-            if self.link.listen() == False:
-                continue
-
-            # Start a receive session
-            self.logger.info("Session started.")
-            session_end_time = time.time() + self.IDLE_TIMEOUT
-            while (time.time() < session_end_time) and (self.is_running):
-                msg = self.receive_data()
-
-                if msg == "":
-                    if self.link.is_connected() == False:
-                        self.logger.info("Connection lost")
-                        break
-                    continue
-
-                # Process the message
-                self.request_hdl.handle_request(self.link, msg)
 
-                if self.link.is_connected() == False:
-                    self.logger.info("Connection lost")
-                    break
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.link, selectors.EVENT_READ, None)
+        self.workers = ThreadPoolExecutor(max_workers=self.MAX_WORKERS)
 
-                # Update the session end time
-                session_end_time = time.time() + self.IDLE_TIMEOUT
+        self.is_running = True
+        while self.is_running:
+            # Wait for new connections or for data from connected clients
+            for key, events in self.selector.select(self.SELECT_TIMEOUT):
+                if key.data == None:
+                    self.accept_connection()
+                else:
+                    self.receive_data(key.data)
 
+            self.close_idle_connections()
 
-            # Indicate if this session has idled out
-            if time.time() >= session_end_time:
-                self.logger.info("Session timed out.")
+        for conn in list(self.connections.values()):
+            self.close_connection(conn)
 
-            self.link.disconnect()
-            self.logger.info("Session ended.")
+        self.workers.shutdown(wait=True)
+        self.selector.close()
 
         self.destroy_link()
         return
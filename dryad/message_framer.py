@@ -0,0 +1,74 @@
+#
+#   Message Framer
+#   Author: Francis T
+#
+#   Splits the byte stream received over a link into request messages
+#
+import re
+import logging
+
+module_logger = logging.getLogger("main.message_framer")
+
+class MessageFramer():
+    def __init__(self, terminators, max_len=2048, encoding="utf-8"):
+        self.max_len = max_len
+        self.encoding = encoding
+
+        # Matches any of the single-character terminators
+        term_bytes = b"".join([ term.encode(encoding) for term in terminators ])
+        self.term_pattern = re.compile(b"[" + re.escape(term_bytes) + b"]")
+
+        # Received bytes which do not form a complete message yet
+        self.buf = bytearray()
+
+        return
+
+    # @desc     Adds received bytes to the buffer and splits off every
+    #           message completed by them. Bytes after the last terminator
+    #           are kept for the next message
+    # @return   A list of messages, each including its terminator
+    def feed(self, data):
+        # Only the new bytes can contain a terminator
+        scan_pos = len(self.buf)
+        self.buf.extend(data)
+
+        messages = []
+        frame_start = 0
+        for match in self.term_pattern.finditer(self.buf, scan_pos):
+            self.add_frame(messages, self.buf[frame_start:match.end()])
+            frame_start = match.end()
+
+        del self.buf[:frame_start]
+
+        # Treat an overly long unterminated message as a whole message
+        if len(self.buf) >= self.max_len:
+            self.add_frame(messages, self.buf)
+            self.buf = bytearray()
+
+        return messages
+
+    # @desc     Takes whatever remains in the buffer as a message
+    # @return   The remaining message, or an empty string
+    def flush(self):
+        messages = []
+        self.add_frame(messages, self.buf)
+        self.buf = bytearray()
+
+        if len(messages) <= 0:
+            return ""
+
+        return messages[0]
+
+    def add_frame(self, messages, frame):
+        # Skip frames made up of nothing but terminators, such as the
+        #   '\n' of a message ending in ";\r\n"
+        if len(self.term_pattern.sub(b"", frame).strip()) <= 0:
+            return
+
+        try:
+            messages.append(frame.decode(self.encoding))
+        except UnicodeDecodeError:
+            module_logger.error("Message not in {} format".format(self.encoding))
+
+        return
+
@@ -8,9 +8,11 @@ import logging
 import time
 
 from queue import Queue
+from collections import deque
 from threading import Thread, Event
 
 from dryad.mobile_node.mobile_bt import MobileNode
+from dryad.message_framer import MessageFramer
 
 class LinkListenerThread(Thread):
 
@@ -25,6 +27,8 @@ class LinkListenerThread(Thread):
 
         self.request_hdl = request_handler
         self.link = None
+        self.framer = MessageFramer(self.MSG_TERMS, self.MAX_RECEIVE_LEN)
+        self.pending_msgs = deque()
         self.is_running = False
         self.logger = logging.getLogger("main.dryad.LinkListenerThread")
         Thread.__init__(self)
@@ -53,14 +57,16 @@ class LinkListenerThread(Thread):
         self.link.destroy()
         return True
 
-    """ Attempts to receive data from the remote device """
+    """ Attempts to receive a message from the remote device """
     def receive_data(self):
+        # Return any message already received along with an earlier one
+        if len(self.pending_msgs) > 0:
+            return self.pending_msgs.popleft()
+
         if self.link.is_connected() == False:
             self.logger.error("Not connected")
             return False
 
-        data_buf = ""
-
         recv_end_time = time.time() + self.RECEIVE_TIMEOUT
 
         # Keep trying to receive data until we've reached the projected receive
@@ -68,13 +74,6 @@ class LinkListenerThread(Thread):
         while (time.time() < recv_end_time) and (self.is_running):
             data_part = self.link.receive_data()
 
-            if data_part is not None:
-                try:
-                    data_part = data_part.decode("utf-8")
-                except:
-                    self.logger.error("Data not in utf-8 format")
-                    break
-   
             # If the data part contains nothing, then try to receive data
             #   again if the thread is still running
             if data_part == None:
@@ -84,26 +83,18 @@ class LinkListenerThread(Thread):
 
                 continue
 
-            # Add this data part to our data buffer
-            data_buf += data_part
-
             # Also, extend our receive end time by a small bit for every
             #   successful piece of data received
             recv_end_time += 1.0
 
-            # If this data part contains the terminator, then we can return
-            #   the data_buffer's contents to the calling context
-            for terminator in self.MSG_TERMS:
-                if terminator in data_part:
-                    return data_buf
-
-            # If we've reached the maximum length of received data, then return
-            #   the current data buffer contents to the calling context
-            if len(data_buf) >= self.MAX_RECEIVE_LEN:
-                return data_buf
+            # Return the first complete message and keep the rest for the
+            #   next calls
+            self.pending_msgs.extend(self.framer.feed(data_part))
+            if len(self.pending_msgs) > 0:
+                return self.pending_msgs.popleft()
 
         self.logger.info("Receive timed out. Returning received content...")
-        return data_buf
+        return self.framer.flush()
 
     """ Run function for this thread """
     def run(self):
@@ -120,6 +111,8 @@ class LinkListenerThread(Thread):
 
             # Start a receive session
             self.logger.info("Session started.")
+            self.framer = MessageFramer(self.MSG_TERMS, self.MAX_RECEIVE_LEN)
+            self.pending_msgs.clear()
             session_end_time = time.time() + self.IDLE_TIMEOUT
             while (time.time() < session_end_time) and (self.is_running):
                 msg = self.receive_data()
@@ -74,7 +74,9 @@ class MobileNode():
 
         print("Sending response...")
         try:
-            self.client_sock.send(resp_data)
+            # Binary responses are corrupted by partial sends, so make sure
+            #   that everything goes out
+            self.client_sock.sendall(resp_data)
         except BluetoothError as e:
             print("Send failed: {}".format(str(e)))
             self.connected = False
@@ -14,8 +14,13 @@ import dryad.sys_info as sys_info
 from time import time, ctime
 
 from utils.transform import DataTransformation
-from dryad.database import DryadDatabase
+from dryad.database import DryadDatabase, SYNC_STREAM_DATA, SYNC_STREAM_RAW
+from dryad.data_records import iter_records
+from dryad.record_frames import RecordFrameEncoder, get_formats
+from dryad.record_frames import FORMAT_JSON, COMPRESS_NONE, COMPRESS_ZLIB
 from dryad.node_state import NodeState
+from dryad.aggregator_node.task import parse_task
+from dryad.mobile_node.request_stats import RequestStats
 from dryad.models import NodeDevice
 from collections import Iterable
 
@@ -26,33 +31,50 @@ TYPE_BLUNO = "BLUNO"
 
 SYS_CMD_UPTIME = 'uptime | cut -d"," -f1'
 
+# @desc     Parses a request argument meant to be a count or a record id
+# @return   The value as a non-negative integer, or None if it is not one
+def parse_count(value):
+    try:
+        value = int(value)
+    except ValueError:
+        return None
+
+    if value < 0:
+        return None
+
+    return value
+
 class RequestHandler():
     def __init__(self, node):
-        self.request_handler_tbl = [
-            { "req_hdr" : "QSTAT", "function" : self.handle_req_state },
-            { "req_hdr" : "QTSET", "function" : self.handle_req_dtime_set },
-            { "req_hdr" : "QACTV", "function" : self.handle_req_activate },
-            { "req_hdr" : "QDEAC", "function" : self.handle_req_deactivate },
-            { "req_hdr" : "QASCP", "function" : self.handle_req_add_collection_params },
-            { "req_hdr" : "QCUPD", "function" : self.handle_req_update_cache },
-            { "req_hdr" : "QNLST", "function" : self.handle_req_list_sensors },
-            { "req_hdr" : "QQRSN", "function" : self.handle_req_setup_sensor },
-            { "req_hdr" : "QSUPD", "function" : self.handle_req_update_sensor },
-            { "req_hdr" : "QDLTE", "function" : self.handle_req_remove_sensor },
-            { "req_hdr" : "QHALT", "function" : self.handle_req_halt },
-            { "req_hdr" : "QRELD", "function" : self.handle_req_reload },
-            { "req_hdr" : "QREBT", "function" : self.handle_req_reboot },
-            { "req_hdr" : "QPWDN", "function" : self.handle_req_shutdown },
-            { "req_hdr" : "QEXTN", "function" : self.handle_req_extend_idle },
-            { "req_hdr" : "QSETP", "function" : self.handle_req_set_param },
-            { "req_hdr" : "QPARL", "function" : self.handle_req_param_list },
-            { "req_hdr" : "QINFO", "function" : self.handle_req_info_list },
-            { "req_hdr" : "QDATA", "function" : self.handle_req_download },
-        ]
+        self.request_handler_tbl = {
+            "QSTAT" : self.handle_req_state,
+            "QTSET" : self.handle_req_dtime_set,
+            "QACTV" : self.handle_req_activate,
+            "QDEAC" : self.handle_req_deactivate,
+            "QASCP" : self.handle_req_add_collection_params,
+            "QCUPD" : self.handle_req_update_cache,
+            "QNLST" : self.handle_req_list_sensors,
+            "QQRSN" : self.handle_req_setup_sensor,
+            "QSUPD" : self.handle_req_update_sensor,
+            "QDLTE" : self.handle_req_remove_sensor,
+            "QHALT" : self.handle_req_halt,
+            "QRELD" : self.handle_req_reload,
+            "QREBT" : self.handle_req_reboot,
+            "QPWDN" : self.handle_req_shutdown,
+            "QEXTN" : self.handle_req_extend_idle,
+            "QSETP" : self.handle_req_set_param,
+            "QPARL" : self.handle_req_param_list,
+            "QINFO" : self.handle_req_info_list,
+            "QDATA" : self.handle_req_download,
+            "QPERF" : self.handle_req_perf_stats,
+            "QSYNC" : self.handle_req_sync,
+            "QSACK" : self.handle_req_sync_ack,
+        }
 
         self.task_node = node
         self.version = self.task_node.get_version()
         self.logger = logging.getLogger("main.RequestHandler")
+        self.request_stats = RequestStats()
 
         return
 
@@ -60,14 +82,14 @@ class RequestHandler():
         # Retrive details about the cache node from the database
         db = DryadDatabase()
         node_matches = db.get_nodes(node_class='SELF')
-        data = db.get_data()
         
         if len(node_matches) <= 0:
             db.close_session()
             self.logger.error("Failed to load data for 'SELF'")
 
-            return link.send_response("RSTAT:FAIL\r\n")
+            return link.send_response("RSTAT:FAIL;\r\n")
 
+        data_stats = db.get_data_stats()
         db.close_session()
 
         # Retrive uptime
@@ -79,7 +101,7 @@ class RequestHandler():
         state =  "'name':'{}','state':'{}','batt':{},'version':'{}',"
         state += "'lat':{},'lon':{},'sys_time':'{}','uptime':'{}',"
         state += "'next_sleep_time':'{}','next_collect_time':'{}',"
-        state += "'size':{}"
+        state += "'size':{},'pending':{},'db_size':{}"
         state = state.format( node_data.name,
                               self.task_node.get_state_str(),
                               -99.0, 
@@ -90,7 +112,9 @@ class RequestHandler():
                               self_uptime,
                               ctime(self.task_node.get_idle_out_time()),
                               ctime(self.task_node.get_collect_time()),
-                              len(data))
+                              data_stats['records'],
+                              data_stats['pending'],
+                              data_stats['db_size'])
         
         return link.send_response("RSTAT:{" + state + "};\r\n")
 
@@ -176,7 +200,10 @@ class RequestHandler():
        
                 sys_info.set_param(param_key, param_val)
 
-        # TODO Trigger parameter reload on the task node
+        # Make sure the parameters are reloaded from the database
+        sys_info.invalidate_params()
+
+        # Trigger parameter reload on the task node
         self.task_node.add_task("RELOAD_PARAMS")
         
         return link.send_response("RASCP:OK;\r\n")
@@ -491,18 +518,34 @@ class RequestHandler():
         return link.send_response("REXTI:OK;\r\n")
 
     def handle_req_set_param(self, link, content):
-        # Add extend idle time task to the task node
+        # Add a set parameters task to the task node
+        params = parse_task("SET_PARAMS " + content).args
+        if len(params) <= 0:
+            return link.send_response("RSETP:FAIL;\r\n")
 
-        self.task_node.add_task("SET_PARAMS " + content)
+        self.task_node.add_task("SET_PARAMS", args=params)
 
         return link.send_response("RSETP:OK;\r\n")
 
+    def handle_req_perf_stats(self, link, content):
+        stats = self.request_stats.get_stats()
+
+        # Start over with fresh stats if requested
+        if "reset=1" in content.lower():
+            self.request_stats.reset()
+
+        return link.send_response("RPERF:{};\r\n".format(json.dumps(stats)))
+
     def handle_req_download(self, link, content):
 
         limit = None
         offset = None
+        after_id = None
+        is_raw = False
         start_id = 0
         end_id = 100000000000000
+        fmt = FORMAT_JSON
+        compress = COMPRESS_NONE
 
         # Parse our argument list
         download_args = content.split(',')
@@ -520,39 +563,198 @@ class RequestHandler():
                 elif arg.lower().startswith("offset="):
                     offset = int(arg.split('=')[1])
 
+                elif arg.lower().startswith("after_id="):
+                    after_id = int(arg.split('=')[1])
+
+                elif arg.lower().startswith("raw="):
+                    is_raw = (arg.split('=')[1].strip() == "1")
+
+                elif arg.lower().startswith("format="):
+                    fmt = arg.split('=')[1].strip().lower()
+
+                elif arg.lower().startswith("compress="):
+                    compress = arg.split('=')[1].strip().lower()
+
+        query = { 'limit'    : limit,
+                  'offset'   : offset,
+                  'start_id' : start_id,
+                  'end_id'   : end_id,
+                  'after_id' : after_id,
+                  'is_raw'   : is_raw }
+
+        return self.send_data(link, "RDATA", query, fmt, compress)
+
+    def handle_req_sync(self, link, content):
+        args = parse_task("SYNC " + content).args
+        if len(args.get('client_id', "")) <= 0:
+            return link.send_response("RSYNC:FAIL;\r\n")
+
+        limit = None
+        if 'limit' in args:
+            limit = parse_count(args['limit'])
+            if limit == None:
+                return link.send_response("RSYNC:FAIL;\r\n")
+
+        is_raw = (args.get('raw') == "1")
+        stream = SYNC_STREAM_RAW if is_raw else SYNC_STREAM_DATA
+
+        db = DryadDatabase()
+        acked_id = db.get_sync_acked_id(args['client_id'], stream)
+        high_water = db.get_last_data_id(is_raw)
+        db.close_session()
+
+        # Resume right after the last acknowledged record, stopping at the
+        #   newest record as of the start of this sync
+        query = { 'limit'    : limit,
+                  'offset'   : None,
+                  'start_id' : 0,
+                  'end_id'   : high_water,
+                  'after_id' : acked_id,
+                  'is_raw'   : is_raw }
+
+        info = { 'acked_id'   : acked_id,
+                 'high_water' : high_water }
+
+        return self.send_data(link, "RSYNC", query,
+                              args.get('format', FORMAT_JSON).lower(),
+                              args.get('compress', COMPRESS_NONE).lower(),
+                              info)
+
+    def handle_req_sync_ack(self, link, content):
+        args = parse_task("SYNC_ACK " + content).args
+        is_reset = (args.get('reset') == "1")
+
+        # Resetting without a record id starts the client over from scratch
+        if (len(args.get('client_id', "")) <= 0) or \
+           (('rec_id' not in args) and not is_reset):
+            return link.send_response("RSACK:FAIL;\r\n")
+
+        rec_id = parse_count(args.get('rec_id', "0"))
+        if rec_id == None:
+            return link.send_response("RSACK:FAIL;\r\n")
+
+        is_raw = (args.get('raw') == "1")
+        stream = SYNC_STREAM_RAW if is_raw else SYNC_STREAM_DATA
+
+        db = DryadDatabase()
+
+        # Records which do not exist yet cannot have been received
+        result = False
+        if rec_id <= db.get_last_data_id(is_raw):
+            result = db.update_sync_cursor(args['client_id'], rec_id,
+                                           stream, reset=is_reset)
+
+        acked_id = db.get_sync_acked_id(args['client_id'], stream)
+        db.close_session()
+
+        if result == False:
+            return link.send_response("RSACK:FAIL;\r\n")
+
+        return link.send_response('RSACK:{{"acked_id": {}}};\r\n'.format(acked_id))
+
+    # @desc     Sends out the records matching a query, either as JSON text or,
+    #           when another format or compression is asked for, as compact
+    #           binary frames. Any extra info is sent along with the records
+    # @return   True if successful, otherwise False
+    def send_data(self, link, resp_hdr, query, fmt=FORMAT_JSON,
+                  compress=COMPRESS_NONE, info=None):
+        if info == None:
+            info = {}
+
+        # Compact binary frames are only sent when asked for
+        if (fmt != FORMAT_JSON) or (compress != COMPRESS_NONE):
+            return self.send_data_frames(link, resp_hdr, query, fmt, compress, info)
+
+        # Paging by record id returns the records along with a continuation
+        #   token; otherwise, only the list of records is returned
+        after_id = query['after_id']
+        limit = query['limit']
+        is_paged = (after_id != None)
+
+        if is_paged:
+            head = ""
+            for key, value in sorted(info.items()):
+                head += '"{}": {}, '.format(key, json.dumps(value))
+
+            result = link.send_response(resp_hdr + ':{' + head + '"data": [')
+        else:
+            result = link.send_response(resp_hdr + ":[")
+
+        # Send the matching records in chunks so that they never have to be
+        #   held in memory all at once
         db = DryadDatabase()
-        matched_data = db.get_data(limit=limit,
-                                   offset=offset,
-                                   start_id=start_id,
-                                   end_id=end_id)
+
+        last_id = after_id
+        send_count = 0
+
+        for records in iter_records(db, **query):
+            if result == False:
+                break
+
+            data = [ json.dumps(record) for record in records ]
+
+            if send_count > 0:
+                result = link.send_response(", " + ", ".join(data))
+            else:
+                result = link.send_response(", ".join(data))
+
+            send_count += len(data)
+            last_id = records[-1]['rec_id']
+
         db.close_session()
 
-        data = []
-        data_str = ""
-        data_block = {}
-        for reading in matched_data:
-            # TODO Format it here
-            data_block['rec_id'] = reading.id
-            data_block['timestamp'] = reading.end_time
-            data_block['sampling_site'] = reading.site_name # TODO
-            data_block['data'] = json.loads(reading.content.replace("'",'"'))
-            data_block['origin'] = { 'name' : reading.name, 
-                                     'lat'  : reading.lat,
-                                     'lon'  : reading.lon,
-                                     'addr' : "---" }
+        if result == False:
+            self.logger.error("Failed to send data")
+            return False
+
+        if is_paged:
+            # A full page may be followed by more records
+            has_more = (limit != None) and (send_count >= limit)
 
+            next_id = last_id if has_more else None
+            return link.send_response('], "next_id": {}}};\r\n'.format(json.dumps(next_id)))
 
-            if 'ph' not in data_block['data']:
-                data_block['data']['ph'] = None
+        return link.send_response("];\r\n")
 
-            if 'bl_batt' not in data_block['data']:
-                data_block['data']['bl_batt'] = None
+    def send_data_frames(self, link, resp_hdr, query, fmt, compress, info):
+        if (fmt not in get_formats()) or (compress not in [ COMPRESS_NONE, COMPRESS_ZLIB ]):
+            self.logger.error("Unsupported data encoding: {}, {}".format(fmt, compress))
+            return link.send_response(resp_hdr + ":FAIL;\r\n")
 
-            data.append(data_block)
+        # The text header tells the client how to read the frames after it
+        header = "{}:BIN,format={},compress={}".format(resp_hdr, fmt, compress)
+        for key, value in sorted(info.items()):
+            header += ",{}={}".format(key, value)
 
-            data_block = {}
+        result = link.send_response(header + ";\r\n")
 
-        return link.send_response("RDATA:{};\r\n".format(json.dumps(data)))
+        encoder = RecordFrameEncoder(fmt, compress)
+        db = DryadDatabase()
+
+        last_id = query['after_id']
+        send_count = 0
+
+        for records in iter_records(db, **query):
+            if result == False:
+                break
+
+            result = link.send_response(encoder.encode_records(records))
+
+            send_count += len(records)
+            last_id = records[-1]['rec_id']
+
+        db.close_session()
+
+        if result == False:
+            self.logger.error("Failed to send data")
+            return False
+
+        # A full page may be followed by more records
+        next_id = None
+        if (query['limit'] != None) and (send_count >= query['limit']):
+            next_id = last_id
+
+        return link.send_response(encoder.encode_end(send_count, next_id))
 
     def handle_request(self, link, request):
         self.logger.info("Message received: {}".format(request))
@@ -566,10 +768,13 @@ class RequestHandler():
         req_hdr = req_parts[0]
         req_content = req_parts[1].strip().strip(';')
 
-        result = False
-        for handler in self.request_handler_tbl:
-            if req_hdr == handler['req_hdr']:
-                result = handler['function'](link, req_content)
+        if req_hdr not in self.request_handler_tbl:
+            self.logger.error("Unknown request: {}".format(req_hdr))
+            return False
+
+        start_time = time()
+        result = self.request_handler_tbl[req_hdr](link, req_content)
+        self.request_stats.record(req_hdr, req_content, time() - start_time, result)
 
         if result == False:
             self.logger.error("Failed to handler {} request".format(req_hdr))
@@ -0,0 +1,113 @@
+"""
+    Name: request_stats.py
+    Author: Francis T
+    Desc: Per-command request counts and latencies for the request handler
+"""
+import heapq
+import logging
+
+from time import time
+from threading import Lock
+
+# Upper bounds (in seconds) of the latency histogram buckets. The last
+#   bucket holds everything slower than the highest bound
+LATENCY_BUCKETS = [ 0.01, 0.05, 0.1, 0.5, 1.0, 5.0 ]
+
+SLOW_REQUEST_THRESHOLD  = 1.0   # Requests taking longer than this are logged
+MAX_SLOW_REQUESTS       = 10    # Number of slowest requests kept
+MAX_LOGGED_ARGS_LEN     = 128
+
+class RequestStats():
+    def __init__(self):
+        self.logger = logging.getLogger("main.RequestStats")
+        self.lock = Lock()
+        self.reset()
+
+        return
+
+    def reset(self):
+        self.lock.acquire()
+
+        self.start_time = time()
+        self.commands = {}
+
+        # Min-heap of the slowest requests so far, fastest on top
+        self.slow_requests = []
+
+        self.lock.release()
+
+        return
+
+    # @desc     Records the outcome and latency of a handled request
+    # @return   None
+    def record(self, req_hdr, req_args, elapsed, result):
+        self.lock.acquire()
+
+        if req_hdr not in self.commands:
+            self.commands[req_hdr] = { 'count'      : 0,
+                                       'failed'     : 0,
+                                       'total_time' : 0.0,
+                                       'max_time'   : 0.0,
+                                       'histogram'  : [0] * (len(LATENCY_BUCKETS) + 1) }
+
+        stats = self.commands[req_hdr]
+        stats['count'] += 1
+        stats['total_time'] += elapsed
+        stats['max_time'] = max(stats['max_time'], elapsed)
+
+        if result == False:
+            stats['failed'] += 1
+
+        bucket = len(LATENCY_BUCKETS)
+        for idx, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                bucket = idx
+                break
+
+        stats['histogram'][bucket] += 1
+
+        # Keep only the slowest requests
+        entry = (elapsed, time(), req_hdr, req_args[:MAX_LOGGED_ARGS_LEN])
+        if len(self.slow_requests) < MAX_SLOW_REQUESTS:
+            heapq.heappush(self.slow_requests, entry)
+        elif elapsed > self.slow_requests[0][0]:
+            heapq.heapreplace(self.slow_requests, entry)
+
+        self.lock.release()
+
+        if elapsed > SLOW_REQUEST_THRESHOLD:
+            self.logger.warning("Slow request: {} took {:.3f} secs (args: {})".format(
+                                    req_hdr, elapsed, req_args[:MAX_LOGGED_ARGS_LEN]))
+
+        return
+
+    # @desc     Gets a summary of the requests recorded so far
+    # @return   A dict of the request stats per command and of the slowest
+    #           requests, slowest first
+    def get_stats(self):
+        self.lock.acquire()
+
+        commands = {}
+        for req_hdr, stats in self.commands.items():
+            commands[req_hdr] = { 'count'     : stats['count'],
+                                  'failed'    : stats['failed'],
+                                  'avg_time'  : stats['total_time'] / stats['count'],
+                                  'max_time'  : stats['max_time'],
+                                  'histogram' : list(stats['histogram']) }
+
+        slow_requests = []
+        for elapsed, timestamp, req_hdr, req_args in sorted(self.slow_requests, reverse=True):
+            slow_requests.append( { 'cmd'       : req_hdr,
+                                    'args'      : req_args,
+                                    'elapsed'   : elapsed,
+                                    'timestamp' : int(timestamp) } )
+
+        since = int(self.start_time)
+
+        self.lock.release()
+
+        return { 'since'         : since,
+                 'buckets'       : LATENCY_BUCKETS,
+                 'commands'      : commands,
+                 'slow_requests' : slow_requests }
+
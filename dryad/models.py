@@ -1,9 +1,9 @@
 import enum
 
-from sqlalchemy import Integer, String, Float, Enum
+from sqlalchemy import Integer, String, Float, Enum, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, ForeignKey, event
+from sqlalchemy import Column, ForeignKey, Index, event
 
 Base = declarative_base()
 
@@ -93,7 +93,7 @@ class Session(Base):
     __tablename__ = 't_sessions'
     id = Column(Integer, primary_key=True)
     start_time = Column(Integer, nullable=False)
-    end_time = Column(Integer)
+    end_time = Column(Integer, index=True)
 
     def __repr__(self):
         return "<Session(id={}, start_time={}, \
@@ -119,7 +119,7 @@ class NodeDevice(Base):
     __tablename__ = 't_node_devices'
     # id = Column(Integer, primary_key=True)
     address = Column(String, primary_key=True)
-    node_id = Column(String, ForeignKey('t_nodes.name'))
+    node_id = Column(String, ForeignKey('t_nodes.name'), index=True)
     device_type = Column(Enum(EnumDeviceType, validate_strings=True))
     power = Column(Float)
 
@@ -131,24 +131,39 @@ class NodeDevice(Base):
                                           self.device_type, self.power)
 
 
+class SensorSchema(Base):
+    __tablename__ = 't_sensor_schemas'
+    id = Column(Integer, primary_key=True)
+    keys = Column(String, nullable=False, unique=True)
+
+    def __repr__(self):
+        return "<SensorSchema(id={}, keys={}>".format(self.id, self.keys)
+
 class NodeData(Base):
     __tablename__ = 't_node_data'
     id = Column(Integer, primary_key=True)
     blk_id = Column(Integer, nullable=False)
-    session_id = Column(Integer, ForeignKey('t_sessions.id'))
-    source_id = Column(String)
+    session_id = Column(Integer, ForeignKey('t_sessions.id'), index=True)
+    source_id = Column(String, index=True)
     content = Column(String)
+    schema_id = Column(Integer, ForeignKey('t_sensor_schemas.id'))
+    packed_values = Column(LargeBinary)
     timestamp = Column(Integer)
 
     session = relationship("Session")
+    schema = relationship("SensorSchema")
 
     def __repr__(self):
         return "<NodeData(id={}, session_id={}, blk_id={}, source_id={}, content={}, \
-        timestamp={}>".format(self.id, self.session_id, self.blk_id,
-                              self.source_id, self.content, self.timestamp)
+        schema_id={}, packed_values={}, timestamp={}>".format(self.id, self.session_id,
+                              self.blk_id, self.source_id, self.content,
+                              self.schema_id, self.packed_values, self.timestamp)
 
 class SessionData(Base):
     __tablename__ = 't_session_data'
+    __table_args__ = (
+        Index('ix_t_session_data_source_id_id', 'source_id', 'id'),
+    )
     id = Column(Integer, primary_key=True)
     session_id = Column(Integer, ForeignKey('t_sessions.id'))
     source_id = Column(String)
@@ -162,6 +177,25 @@ class SessionData(Base):
         timestamp={}>".format(self.id, self.session_id, self.source_id,
                               self.content, self.timestamp)
 
+class RawData(Base):
+    __tablename__ = 't_raw_data'
+    id = Column(Integer, primary_key=True)
+    session_id = Column(Integer, ForeignKey('t_sessions.id'))
+    source_id = Column(String, index=True)
+    sensor = Column(String, nullable=False)
+    cal_version = Column(Integer, nullable=False)
+    raw = Column(LargeBinary, nullable=False)
+    timestamp = Column(Integer)
+
+    session = relationship("Session")
+
+    def __repr__(self):
+        return "<RawData(id={}, session_id={}, source_id={}, sensor={}, \
+        cal_version={}, raw={}, timestamp={}>".format(self.id, self.session_id,
+                                                      self.source_id, self.sensor,
+                                                      self.cal_version, self.raw,
+                                                      self.timestamp)
+
 class NodeEvent(Base):
     __tablename__ = 't_node_events'
     id = Column(Integer, primary_key=True)
@@ -176,6 +210,49 @@ class NodeEvent(Base):
         timestamp={}>".format(self.id, self.node_id, self.event_type,
                               self.timestamp)
 
+class NodeGattHandles(Base):
+    __tablename__ = 't_node_gatt_handles'
+    address = Column(String, primary_key=True)
+    firmware = Column(String, primary_key=True)
+    handles = Column(String, nullable=False)
+
+    def __repr__(self):
+        return "<NodeGattHandles(address={}, firmware={}, handles={}>".format(
+            self.address, self.firmware, self.handles)
+
+class NodeLinkStats(Base):
+    __tablename__ = 't_node_link_stats'
+    address = Column(String, primary_key=True)
+    node_id = Column(String)
+    connect_attempts = Column(Integer, nullable=False, default=0)
+    connect_successes = Column(Integer, nullable=False, default=0)
+    consecutive_failures = Column(Integer, nullable=False, default=0)
+    success_rate = Column(Float)
+    avg_connect_time = Column(Float)
+    avg_read_duration = Column(Float)
+    last_success = Column(Integer)
+
+    def __repr__(self):
+        return "<NodeLinkStats(address={}, node_id={}, connect_attempts={}, \
+        connect_successes={}, consecutive_failures={}, success_rate={}, \
+        avg_connect_time={}, avg_read_duration={}, last_success={}>".format(
+            self.address, self.node_id, self.connect_attempts,
+            self.connect_successes, self.consecutive_failures,
+            self.success_rate, self.avg_connect_time,
+            self.avg_read_duration, self.last_success)
+
+class SyncCursor(Base):
+    __tablename__ = 't_sync_cursors'
+    client_id = Column(String, primary_key=True)
+    stream = Column(String, primary_key=True)
+    acked_id = Column(Integer, nullable=False, default=0)
+    updated_time = Column(Integer)
+
+    def __repr__(self):
+        return "<SyncCursor(client_id={}, stream={}, acked_id={}, \
+        updated_time={}>".format(self.client_id, self.stream, self.acked_id,
+                                 self.updated_time)
+
 class Exception(Base):
     __tablename__ = 't_exception'
     id = Column(Integer, primary_key=True)
@@ -0,0 +1,177 @@
+#
+#   Record Frames
+#   Author: Francis T
+#
+#   Compact, framed encoding of data records for slow links. Node origins
+#   and data key sets are sent once each and then referred to by index,
+#   leaving every record as a short row:
+#
+#       [ rec_id, timestamp, origin_idx, schema_idx, [ values ] ]
+#
+#   Raw sample rows also end with their calibration version. Each frame is
+#   a 4-byte big-endian payload length, the CRC-32 of the payload and then
+#   the payload itself: one encoded message of the form
+#
+#       { 'origins' : [ new origins ], 'schemas' : [ new key lists ],
+#         'rows'    : [ rows ] }
+#
+#   Indices count every origin and schema sent so far in the response. The
+#   last message holds { 'count' : <rows sent>, 'next_id' : <id or None> }
+#   and is followed by an empty frame (zero length and checksum), so that
+#   readers can find the end of a response without decoding it. With zlib
+#   compression, all frames share a single compression stream which is
+#   flushed at the end of each frame
+#
+import json
+import struct
+import zlib
+
+# MessagePack and CBOR are optional; JSON is always available
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+FORMAT_JSON         = "json"
+FORMAT_MSGPACK      = "msgpack"
+FORMAT_CBOR         = "cbor"
+
+COMPRESS_NONE       = "none"
+COMPRESS_ZLIB       = "zlib"
+
+FRAME_HEADER        = struct.Struct(">II")
+END_FRAME           = FRAME_HEADER.pack(0, 0)
+ZLIB_LEVEL          = 6
+
+# @desc     Lists the encoding formats usable with the installed modules
+# @return   A list of format names
+def get_formats():
+    formats = [ FORMAT_JSON ]
+    if msgpack is not None:
+        formats.append(FORMAT_MSGPACK)
+
+    if cbor2 is not None:
+        formats.append(FORMAT_CBOR)
+
+    return formats
+
+def encode_message(msg, fmt):
+    if fmt == FORMAT_MSGPACK:
+        return msgpack.packb(msg, use_bin_type=True)
+
+    if fmt == FORMAT_CBOR:
+        return cbor2.dumps(msg)
+
+    return json.dumps(msg, separators=(',', ':')).encode('UTF-8')
+
+def decode_message(payload, fmt):
+    if fmt == FORMAT_MSGPACK:
+        return msgpack.unpackb(payload, raw=False)
+
+    if fmt == FORMAT_CBOR:
+        return cbor2.loads(payload)
+
+    return json.loads(payload.decode('UTF-8'))
+
+class RecordFrameEncoder():
+    def __init__(self, fmt=FORMAT_JSON, compress=COMPRESS_NONE):
+        if fmt not in get_formats():
+            raise ValueError("Unavailable format: {}".format(fmt))
+
+        if compress not in [ COMPRESS_NONE, COMPRESS_ZLIB ]:
+            raise ValueError("Unknown compression: {}".format(compress))
+
+        self.fmt = fmt
+        self.compressor = None
+        if compress == COMPRESS_ZLIB:
+            self.compressor = zlib.compressobj(ZLIB_LEVEL)
+
+        # Indices of the origins and schemas already sent, keyed by node
+        #   name and by key list
+        self.origins = {}
+        self.schemas = {}
+        return
+
+    # @desc     Encodes a list of records (as built by dryad.data_records)
+    # @return   The frame as bytes
+    def encode_records(self, records):
+        msg = { 'origins' : [], 'schemas' : [], 'rows' : [] }
+
+        for record in records:
+            origin = record['origin']
+            if origin['name'] not in self.origins:
+                self.origins[origin['name']] = len(self.origins)
+                msg['origins'].append( { 'name'      : origin['name'],
+                                         'lat'       : origin['lat'],
+                                         'lon'       : origin['lon'],
+                                         'site_name' : record['sampling_site'] } )
+
+            keys = tuple(sorted(record['data'].keys()))
+            if keys not in self.schemas:
+                self.schemas[keys] = len(self.schemas)
+                msg['schemas'].append(list(keys))
+
+            row = [ record['rec_id'],
+                    record['timestamp'],
+                    self.origins[origin['name']],
+                    self.schemas[keys],
+                    [ record['data'][key] for key in keys ] ]
+
+            if 'cal_version' in record:
+                row.append(record['cal_version'])
+
+            msg['rows'].append(row)
+
+        return self.encode_frame(msg)
+
+    # @desc     Encodes the closing message of a response along with the
+    #           empty frame marking its end
+    # @return   The frames as bytes
+    def encode_end(self, count, next_id=None):
+        return self.encode_frame({ 'count' : count, 'next_id' : next_id }) + \
+               END_FRAME
+
+    def encode_frame(self, msg):
+        payload = encode_message(msg, self.fmt)
+
+        if self.compressor != None:
+            payload = self.compressor.compress(payload) + \
+                      self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        return FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+# @desc     Decodes the frames of a whole response; mainly meant for testing
+#           and for reference by client implementations
+# @return   A list of decoded messages
+def decode_frames(data, fmt=FORMAT_JSON, compress=COMPRESS_NONE):
+    decompressor = None
+    if compress == COMPRESS_ZLIB:
+        decompressor = zlib.decompressobj()
+
+    messages = []
+    pos = 0
+    while pos < len(data):
+        length, checksum = FRAME_HEADER.unpack_from(data, pos)
+        pos += FRAME_HEADER.size
+
+        if length == 0:
+            break
+
+        payload = bytes(data[pos:pos + length])
+        pos += length
+
+        if (len(payload) != length) or (zlib.crc32(payload) != checksum):
+            raise ValueError("Corrupted frame at offset {}".format(pos - length))
+
+        if decompressor != None:
+            payload = decompressor.decompress(payload)
+
+        messages.append(decode_message(payload, fmt))
+
+    return messages
+
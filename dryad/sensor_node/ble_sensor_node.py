@@ -21,31 +21,44 @@ MAX_CONN_RETRIES        = 60
 CONN_ATTEMPT_TIMEOUT    = 35.0
 CONN_ATTEMPT_INTERVAL   = 0.1
 READ_INTERVAL           = 20.0          # Number of seconds between reads
+RAW_ARCHIVE             = 0             # Set to 1 to keep raw samples instead
+                                        #   of calibrated values
 
 class BleSensorNode(BaseSensorNode, metaclass=ABCMeta):
-    def __init__(self, node_name, node_address, logger, event_read_complete):
+    def __init__(self, node_name, node_address, logger, event_read_complete, data_writer=None):
         BaseSensorNode.__init__(self, node_name, node_address)
         self.logger = logger
         self.event_read_complete = event_read_complete
+        self.data_writer = data_writer
 
         self.peripheral = None
         self.read_thread = None
         self.is_connected = False
         self.readings = []
 
+        # Connection quality figures for this collection cycle
+        self.connect_attempts = 0
+        self.connect_time = None
+        self.read_duration = None
+
+        # Set when a connect attempt takes longer than conn_attempt_timeout,
+        #   which usually means that the device is out of range
+        self.is_conn_timed_out = False
+
         self.max_conn_retries       = MAX_CONN_RETRIES
         self.conn_attempt_timeout   = CONN_ATTEMPT_TIMEOUT
         self.conn_attempt_interval  = CONN_ATTEMPT_INTERVAL
         self.max_sample_count       = MAX_SAMPLE_COUNT
         self.max_sampling_duration  = MAX_SAMPLING_DURATION
         self.read_interval          = READ_INTERVAL
+        self.raw_archive            = False
 
         # Load params from database instead of using defaults
         self.reload_system_params()
 
         return
 
-    def connect(self):
+    def connect(self, max_retries=None):
         # Update the state
         self.set_state("CONNECTING")
 
@@ -55,18 +68,24 @@ class BleSensorNode(BaseSensorNode, metaclass=ABCMeta):
 
         self.logger.info("[{}] Attempting to connect to {}".format(self.get_name(), self.get_address()))
 
+        if max_retries == None:
+            max_retries = self.max_conn_retries
+
         retries = 0
         is_connected = False
         start_time = time.time()
+        self.is_conn_timed_out = False
 
-        while (self.peripheral is None) and (retries < self.max_conn_retries):
+        while (self.peripheral is None) and (retries < max_retries):
             conn_success = True
             conn_attempt_time = time.time()
 
+            self.connect_attempts += 1
+
             try:
                 self.peripheral = Peripheral(self.get_address(), "public")
             except Exception as e:
-                self.logger.error("[{}] Connecton failed: {}".format(self.get_name(), e.message))
+                self.logger.error("[{}] Connecton failed: {}".format(self.get_name(), str(e)))
                 conn_success = False
 
             elapsed_time = time.time() - conn_attempt_time
@@ -74,6 +93,7 @@ class BleSensorNode(BaseSensorNode, metaclass=ABCMeta):
             # End the loop if connection is successful
             if conn_success:
                 self.logger.debug("[{}] Overall connect time: {} secs, Total retries: {}".format(self.get_name(), time.time() - start_time, retries))
+                self.connect_time = elapsed_time
                 is_connected = True
                 break
 
@@ -81,9 +101,12 @@ class BleSensorNode(BaseSensorNode, metaclass=ABCMeta):
             if elapsed_time > self.conn_attempt_timeout:
                 self.logger.debug("[{}] Connect attempt took {} secs".format(self.get_name(), elapsed_time))
                 self.logger.warning("[{}] Connect attempt exceeds threshold. Is the device nearby?".format(self.get_name()))
+                self.is_conn_timed_out = True
                 break
 
             retries += 1
+            if retries >= max_retries:
+                break
 
             time.sleep(self.conn_attempt_interval)
             self.logger.debug("[{}] Attempting to connect ({})...".format(self.get_name(), retries))
@@ -172,42 +195,26 @@ class BleSensorNode(BaseSensorNode, metaclass=ABCMeta):
         return self.peripheral
     
     def reload_system_params(self):
-        records = sys_info.get_param("MAX_CONN_RETRIES")
-        if records != False:
-            self.max_conn_retries = int(records[0].value)
-        else:
-            sys_info.set_param("MAX_CONN_RETRIES", str(MAX_CONN_RETRIES))
+        self.max_conn_retries = sys_info.get_int_param("MAX_CONN_RETRIES",
+                                                       MAX_CONN_RETRIES)
 
-        records = sys_info.get_param("CONN_ATTEMPT_TIMEOUT")
-        if records != False:
-            self.conn_attempt_timeout = float(records[0].value)
-        else:
-            sys_info.set_param("CONN_ATTEMPT_TIMEOUT", str(CONN_ATTEMPT_TIMEOUT))
+        self.conn_attempt_timeout = sys_info.get_float_param("CONN_ATTEMPT_TIMEOUT",
+                                                             CONN_ATTEMPT_TIMEOUT)
 
-        records = sys_info.get_param("CONN_ATTEMPT_INTERVAL")
-        if records != False:
-            self.conn_attempt_interval = float(records[0].value)
-        else:
-            sys_info.set_param("CONN_ATTEMPT_INTERVAL", str(CONN_ATTEMPT_INTERVAL))
+        self.conn_attempt_interval = sys_info.get_float_param("CONN_ATTEMPT_INTERVAL",
+                                                              CONN_ATTEMPT_INTERVAL)
 
-        records = sys_info.get_param("MAX_SAMPLE_COUNT")
-        if records != False:
-            self.max_sample_count = int(records[0].value)
-        else:
-            sys_info.set_param("MAX_SAMPLE_COUNT", str(MAX_SAMPLE_COUNT))
+        self.max_sample_count = sys_info.get_int_param("MAX_SAMPLE_COUNT",
+                                                       MAX_SAMPLE_COUNT)
 
+        self.max_sampling_duration = sys_info.get_float_param("MAX_SAMPLING_DURATION",
+                                                              MAX_SAMPLING_DURATION)
 
-        records = sys_info.get_param("MAX_SAMPLING_DURATION")
-        if records != False:
-            self.max_sampling_duration = float(records[0].value)
-        else:
-            sys_info.set_param("MAX_SAMPLING_DURATION", str(MAX_SAMPLING_DURATION))
+        self.read_interval = sys_info.get_float_param("READ_INTERVAL",
+                                                      READ_INTERVAL)
 
-        records = sys_info.get_param("READ_INTERVAL")
-        if records != False:
-            self.read_interval = float(records[0].value)
-        else:
-            sys_info.set_param("READ_INTERVAL", str(READ_INTERVAL))
+        self.raw_archive = (sys_info.get_int_param("RAW_ARCHIVE",
+                                                   RAW_ARCHIVE) == 1)
 
         return
 
@@ -32,6 +32,7 @@ DEVINFO_CHARS = {
 }
 
 SERIAL_HDL = 37
+RAW_SENSOR = "BLUNO"
 MAX_CONN_RETRIES = 40  # old number was 10
 
 DEBUG_RAW_DATA = True
@@ -72,10 +73,11 @@ class PeripheralDelegate(DefaultDelegate):
                 val = data.split("=")[1].split(";")[0].strip()
 
                 try:
+                    raw_val = float(val)
                     if key is "ph":
-                        val = tr.conv_ph(float(val))
+                        val = tr.conv_ph(raw_val)
                     else:
-                        val = tr.conv_batt(float(val))
+                        val = tr.conv_batt(raw_val)
                 except:
                     self.logger.error("[{}] Cannot convert {} data ({}) to float".format(
                         self.peripheral.get_name(), key,  val))
@@ -83,6 +85,11 @@ class PeripheralDelegate(DefaultDelegate):
                     return
                 self.last_reading = {key: val, "ts": int(time.time()) }
 
+                # Keep the unconverted value when archiving raw samples
+                if self.peripheral.raw_archive:
+                    self.last_reading['raw'] = { 'sensor' : RAW_SENSOR,
+                                                 'data'   : transform.pack_raw(RAW_SENSOR, {key: raw_val}) }
+
             self.logger.debug("[{}] Received: {}".format( self.peripheral.get_name(), str(data) ))
 
         return
@@ -132,6 +139,8 @@ class BlunoReadThread(ReadThread):
         peripheral = self.parent.get_peripheral()
         peripheral.setDelegate(self.pdelegate)
 
+        read_start = time.time()
+
         try:
             # This is preserved for old sensor node versions
             self.parent.req_deploy(serial_ch)
@@ -152,6 +161,7 @@ class BlunoReadThread(ReadThread):
                     time.sleep(self.read_interval)
 
             self.logger.info("[{}] Finished QREAD".format(self.parent.get_name()))
+            self.parent.read_duration = time.time() - read_start
 
             if (self.parent.is_connected == False):
                 self.notify_done()
@@ -169,10 +179,11 @@ class BlunoReadThread(ReadThread):
 
 
 class BlunoSensorNode(BleSensorNode):
-    def __init__(self, node_id, node_address, event_read_complete):
+    def __init__(self, node_id, node_address, event_read_complete, data_writer=None):
         logger = logging.getLogger("main.bluno_sensor_node.BlunoSensorNode")
         BleSensorNode.__init__(self, node_id, node_address, logger, \
-                               event_read_complete=event_read_complete)
+                               event_read_complete=event_read_complete,
+                               data_writer=data_writer)
 
         self.live_measure_period = "\x01"
         return
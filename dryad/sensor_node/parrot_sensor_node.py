@@ -6,8 +6,10 @@
 #   Soil Sensor
 #
 import time
+import json
 import logging
 import utils.transform as transform
+import dryad.sys_info as sys_info
 
 from dryad.database import DryadDatabase
 from dryad.sensor_node.ble_sensor_node import BleSensorNode
@@ -59,8 +61,53 @@ CONTROLS = {
 FLAG_NOTIF_ENABLE   = "\x01\x00"
 FLAG_NOTIF_DISABLE  = "\x00\x00"
 
+# Sensor type of the raw samples kept in raw archival mode
+RAW_SENSOR          = "PARROT"
+
+# Read modes
+#   POLL - read every sensor characteristic once per sample
+#   LIVE - have the device notify the live sensor values and only read
+#          the remaining characteristics
+READ_MODE_POLL      = "POLL"
+READ_MODE_LIVE      = "LIVE"
+
+# Sensors streamed by the device while in live measure mode
+LIVE_SENSORS        = [ "sunlight", "soil_temp", "air_temp", "vwc" ]
+LIVE_WAIT_TIMEOUT   = 3.0       # Max seconds to wait for live notifications
+
+# Client characteristic configuration descriptor, written to turn on the
+#   notifications of a characteristic
+CCCD_UUID           = 0x2902
+
 DEBUG_RAW_DATA = False
 
+class ParrotLiveDelegate(DefaultDelegate):
+    def __init__(self, handles):
+        DefaultDelegate.__init__(self)
+
+        # Map the notifying value handles back to their sensor names
+        self.sensor_keys = {}
+        for key in LIVE_SENSORS:
+            if key in handles:
+                self.sensor_keys[handles[key]] = key
+
+        self.values = {}
+        return
+
+    def handleNotification(self, cHandle, data):
+        if cHandle in self.sensor_keys:
+            self.values[self.sensor_keys[cHandle]] = data
+
+        return
+
+    def has_all_values(self):
+        return len(self.values) >= len(self.sensor_keys)
+
+    def get_values(self):
+        values = self.values
+        self.values = {}
+        return values
+
 class ParrotReadThread(ReadThread):
     def __init__(self, parent, func_read, readings, logger=None, event_done=None, event_read=None, \
                  event_error=None, read_samples=0, read_time=0, read_interval=0):
@@ -92,18 +139,28 @@ class ParrotReadThread(ReadThread):
         return
 
 class ParrotSensorNode(BleSensorNode):
-    def __init__(self, node_id, node_address, event_read_complete):
+    def __init__(self, node_id, node_address, event_read_complete, data_writer=None):
         logger = logging.getLogger("main.ParrotSensorNode")
         BleSensorNode.__init__(self, node_id, node_address, logger, \
-                               event_read_complete=event_read_complete)
+                               event_read_complete=event_read_complete,
+                               data_writer=data_writer)
 
         self.live_measure_period = "\x01"
+
+        # Characteristic value handles, keyed by sensor or control name
+        self.handles = {}
+        self.firmware_ver = None
+        self.live_delegate = None
         return
 
     def start(self):
+        func_read = self.gather_data
+        if self.read_mode == READ_MODE_LIVE:
+            func_read = self.gather_live_data
+
         if self.read_thread == None:
             self.read_thread = ParrotReadThread(parent=self,
-                                                func_read=self.gather_data,
+                                                func_read=func_read,
                                                 readings=self.readings,
                                                 event_done=self.event_read_complete,
                                                 read_samples=self.max_sample_count,
@@ -122,14 +179,14 @@ class ParrotSensorNode(BleSensorNode):
 
         tr = transform.DataTransformation()
         reading = dict.fromkeys(sensors)
+        raw_values = {}
 
         # Reading battery level from battery service
-        battery_level_ch = self.battery_service.getCharacteristics(UUID(CONTROLS["BATTERY_LEVEL"]))[0]
         battery_level = 0
         
         try:
             # conversion from byte to decimal
-            battery_level = ord(battery_level_ch.read())
+            battery_level = ord(self.peripheral.readCharacteristic(self.handles["BATTERY_LEVEL"]))
             if "pf_batt" in reading.keys():
                 reading["pf_batt"] = battery_level
         except Exception as err:
@@ -144,66 +201,279 @@ class ParrotSensorNode(BleSensorNode):
             if key not in sensors:
                 # Skip all sensors we aren't reading this time
                 continue
-            svchar_live = self.live_service.getCharacteristics(UUID(val)) 
-            if len(svchar_live) <= 0:
+            if key not in self.handles:
                 #self.logger.debug("No characteristic: {}, {}".format(key, val))
                 continue
 
-            char = svchar_live[0]
-            if char.supportsRead(): 
-                try:
-                    if DEBUG_RAW_DATA and (key in ["sunlight", "soil_ec", "air_temp", "soil_temp", "vwc"]):
-                        reading[key] = tr.unpack_U16(char.read())
-                    elif not DEBUG_RAW_DATA:
-                        if key == "sunlight":
-                            reading[key] = tr.conv_light(tr.unpack_U16(char.read()))
-                        elif key == "soil_ec":
-                            reading[key] = tr.conv_ec(tr.unpack_U16(char.read()))
-                            # Support cases where firmware is old
-                            if reading["cal_dli"] == None:
-                                reading["cal_dli"] = reading[key] 
-                                reading["cal_ea"] = reading[key] 
-                                reading["cal_ecb"] = reading[key] 
-                                reading["cal_ec_porous"] = reading[key] 
-                        elif key in "soil_temp":
-                            reading[key] = tr.conv_temp(tr.unpack_U16(char.read()))
-                        elif key == "air_temp": 
-                            reading[key] = tr.conv_temp(tr.unpack_U16(char.read()))
-                            # Support cases where firmware is old
-                            if reading["cal_air_temp"] == None:
-                                reading["cal_air_temp"] = reading[key] 
-                        elif key == "vwc":
-                            reading[key] = tr.conv_moisture(tr.unpack_U16(char.read()))
-                            # Support cases where firmware is old
-                            if reading["cal_vwc"] == None:
-                                reading["cal_vwc"] = reading[key] 
-                        else:
-                            reading[key] = tr.decode_float32(char.read())
-                                        
-                except Exception as e:
-                    self.logger.exception("[{}] Failed to read and decode sensor data: {}".format(str(self.get_name()), char.read()))
+            # Only readable characteristics have their handles kept
+            handle = self.handles[key]
+            try:
+                raw_data = self.peripheral.readCharacteristic(handle)
+                self.decode_sensor(tr, reading, key, raw_data)
+                raw_values[key] = transform.unpack_raw_field(RAW_SENSOR, key, raw_data)
+
+            except Exception as e:
+                self.logger.exception("[{}] Failed to read and decode sensor data: {} (handle {})".format(str(self.get_name()), key, handle))
 
         reading['ts'] = int(time.time())
+        if self.raw_archive:
+            raw_values["pf_batt"] = reading["pf_batt"]
+            reading['raw'] = { 'sensor' : RAW_SENSOR,
+                               'data'   : transform.pack_raw(RAW_SENSOR, raw_values) }
+
         self.switch_led(FLAG_NOTIF_DISABLE)
 
         return reading
 
+    # @desc     Reads a sample using the device's live measure mode. The live
+    #           sensor values are taken from the notifications sent by the
+    #           device while all other characteristics are still read
+    # @return   A dict containing the reading, or None on failure
+    def gather_live_data(self, on_error_flag=None, on_read_flag=None):
+        sensors=[ "sunlight", "soil_temp", "air_temp", \
+                  "vwc", "cal_vwc", "cal_air_temp", \
+                  "cal_dli", "cal_ea", "cal_ecb", \
+                  "cal_ec_porous", "pf_batt" ]
+
+        if self.live_delegate == None:
+            return self.gather_data(on_error_flag, on_read_flag)
+
+        tr = transform.DataTransformation()
+        reading = dict.fromkeys(sensors)
+        raw_values = {}
+
+        try:
+            # conversion from byte to decimal
+            reading["pf_batt"] = ord(self.peripheral.readCharacteristic(self.handles["BATTERY_LEVEL"]))
+        except Exception as err:
+            self.logger.error("[{}] Exception occurred: {}".format(self.get_name(), str(err)))
+            return None
+
+        self.switch_led(FLAG_NOTIF_ENABLE)
+
+        # Wait for the device to send out the latest live sensor values
+        wait_end = time.time() + LIVE_WAIT_TIMEOUT
+        try:
+            while (not self.live_delegate.has_all_values()) and (time.time() < wait_end):
+                self.peripheral.waitForNotifications(max(wait_end - time.time(), 0.0))
+        except Exception as err:
+            self.logger.error("[{}] Exception occurred: {}".format(self.get_name(), str(err)))
+            return None
+
+        live_values = self.live_delegate.get_values()
+
+        # Keep the same key order as gather_data so that values from the
+        #   calibrated characteristics still take over the fallbacks
+        for key, val in CAL_SENSORS.items():
+            if key not in sensors:
+                continue
+            if key not in self.handles:
+                continue
+
+            handle = self.handles[key]
+            try:
+                if key in live_values:
+                    raw_data = live_values[key]
+                else:
+                    # Poll anything the device did not send in time
+                    raw_data = self.peripheral.readCharacteristic(handle)
+
+                self.decode_sensor(tr, reading, key, raw_data)
+                raw_values[key] = transform.unpack_raw_field(RAW_SENSOR, key, raw_data)
+
+            except Exception as e:
+                self.logger.exception("[{}] Failed to read and decode sensor data: {} (handle {})".format(str(self.get_name()), key, handle))
+
+        reading['ts'] = int(time.time())
+        if self.raw_archive:
+            raw_values["pf_batt"] = reading["pf_batt"]
+            reading['raw'] = { 'sensor' : RAW_SENSOR,
+                               'data'   : transform.pack_raw(RAW_SENSOR, raw_values) }
+
+        self.switch_led(FLAG_NOTIF_DISABLE)
+
+        return reading
+
+    def decode_sensor(self, tr, reading, key, raw_data):
+        if DEBUG_RAW_DATA and (key in ["sunlight", "soil_ec", "air_temp", "soil_temp", "vwc"]):
+            reading[key] = tr.unpack_U16(raw_data)
+        elif not DEBUG_RAW_DATA:
+            if key == "sunlight":
+                reading[key] = tr.lookup("conv_light", raw_data)
+            elif key == "soil_ec":
+                reading[key] = tr.lookup("conv_ec", raw_data)
+                # Support cases where firmware is old
+                if reading["cal_dli"] == None:
+                    reading["cal_dli"] = reading[key] 
+                    reading["cal_ea"] = reading[key] 
+                    reading["cal_ecb"] = reading[key] 
+                    reading["cal_ec_porous"] = reading[key] 
+            elif key in "soil_temp":
+                reading[key] = tr.lookup("conv_temp", raw_data)
+            elif key == "air_temp": 
+                reading[key] = tr.lookup("conv_temp", raw_data)
+                # Support cases where firmware is old
+                if reading["cal_air_temp"] == None:
+                    reading["cal_air_temp"] = reading[key] 
+            elif key == "vwc":
+                reading[key] = tr.lookup("conv_moisture", raw_data)
+                # Support cases where firmware is old
+                if reading["cal_vwc"] == None:
+                    reading["cal_vwc"] = reading[key] 
+            else:
+                reading[key] = tr.decode_float32(raw_data)
+
+
+        return
+
     def setup_connection(self): 
-        # getting firmware version of parrotflower        
-        device_info_service = self.peripheral.getServiceByUUID(UUID(SERVICES["DEVICE_INFO"]))
-        firmware_ver_ch = device_info_service.getCharacteristics(UUID(CONTROLS["FIRMWARE_VER"]))[0]
-        firmware_ver_str = firmware_ver_ch.read()
-        
+        # Reuse the characteristic handles found in an earlier session if
+        #   the device firmware has not changed since; otherwise, discover
+        #   them from the device
+        if self.load_handles() == False:
+            self.discover_handles()
+
         # check firmware
         new_firmware_version = '1.1.0'
-        ver_number = firmware_ver_str.decode("utf-8").split("_")[1].split("-")[1]
+        ver_number = self.firmware_ver.split("_")[1].split("-")[1]
         self.is_new_firmware = (ver_number == new_firmware_version)
 
         # setting live measure period
         self.set_live_measure_period()    
-    
+
+        if self.read_mode == READ_MODE_LIVE:
+            if self.enable_live_notifications() == False:
+                self.logger.warning("[{}] Falling back to {} mode".format(
+                                        self.get_name(), READ_MODE_POLL))
+                self.read_mode = READ_MODE_POLL
+
+        return True
+
+    def enable_live_notifications(self):
+        # Only go live if the configuration descriptors of all of the live
+        #   characteristics were found
+        cccd_handles = self.handles.get("CCCD", {})
+        for key in LIVE_SENSORS:
+            if (key in self.handles) and (key not in cccd_handles):
+                self.logger.warning("[{}] No notification descriptor found for {}".format(
+                                        self.get_name(), key))
+                return False
+
+        self.live_delegate = ParrotLiveDelegate(self.handles)
+        self.peripheral.setDelegate(self.live_delegate)
+
+        for key in LIVE_SENSORS:
+            if key not in self.handles:
+                continue
+
+            try:
+                self.peripheral.writeCharacteristic(cccd_handles[key],
+                                                    str.encode(FLAG_NOTIF_ENABLE))
+            except Exception as e:
+                self.logger.error("[{}] Failed to enable notifications for {}: {}".format(
+                                    self.get_name(), key, str(e)))
+                self.live_delegate = None
+                return False
+
+        return True
+
+    def reload_system_params(self):
+        BleSensorNode.reload_system_params(self)
+
+        self.read_mode = sys_info.get_str_param("PARROT_READ_MODE", READ_MODE_POLL).upper()
+        if self.read_mode not in [ READ_MODE_POLL, READ_MODE_LIVE ]:
+            self.logger.error("Invalid read mode: {}".format(self.read_mode))
+            self.read_mode = READ_MODE_POLL
+
+        return
+
+    def load_handles(self):
+        db = DryadDatabase()
+        records = db.get_gatt_handles(self.get_address())
+        db.close_session()
+
+        if (records == False) or (len(records) <= 0):
+            return False
+
+        # Read the firmware version through a previously saved handle and
+        #   look for the handles saved for that version
+        try:
+            handles = json.loads(records[0].handles)
+            firmware_ver_str = self.peripheral.readCharacteristic(handles["FIRMWARE_VER"])
+            firmware_ver = firmware_ver_str.decode("utf-8")
+        except Exception as e:
+            self.logger.info("[{}] Saved handles unusable: {}".format(self.get_name(), str(e)))
+            return False
+
+        for record in records:
+            # Handles saved before descriptors were looked up lack the
+            #   "CCCD" entry and have to be discovered again
+            handles = json.loads(record.handles)
+            if (record.firmware == firmware_ver) and ("CCCD" in handles):
+                self.handles = handles
+                self.firmware_ver = firmware_ver
+                self.logger.debug("[{}] Loaded saved handles".format(self.get_name()))
+                return True
+
+        return False
+
+    def discover_handles(self):
+        self.logger.debug("[{}] Discovering handles".format(self.get_name()))
+        handles = {}
+
+        # getting firmware version of parrotflower        
+        device_info_service = self.peripheral.getServiceByUUID(UUID(SERVICES["DEVICE_INFO"]))
+        firmware_ver_ch = device_info_service.getCharacteristics(UUID(CONTROLS["FIRMWARE_VER"]))[0]
+        handles["FIRMWARE_VER"] = firmware_ver_ch.getHandle()
+
         # getting pf battery service
-        self.battery_service = self.peripheral.getServiceByUUID(UUID(SERVICES["BATTERY"]))
+        battery_service = self.peripheral.getServiceByUUID(UUID(SERVICES["BATTERY"]))
+        battery_level_ch = battery_service.getCharacteristics(UUID(CONTROLS["BATTERY_LEVEL"]))[0]
+        handles["BATTERY_LEVEL"] = battery_level_ch.getHandle()
+
+        # getting live services for controlling led and live measure period
+        live_service = self.peripheral.getServiceByUUID(UUID(SERVICES["LIVE"]))
+        for key in [ "LIVE_MODE_PERIOD", "LED" ]:
+            control_ch = live_service.getCharacteristics(UUID(CONTROLS[key]))[0]
+            handles[key] = control_ch.getHandle()
+
+        # getting the readable sensor characteristics
+        cccd_handles = {}
+        for key, val in CAL_SENSORS.items():
+            svchar_live = live_service.getCharacteristics(UUID(val))
+            if len(svchar_live) <= 0:
+                continue
+
+            if svchar_live[0].supportsRead():
+                handles[key] = svchar_live[0].getHandle()
+
+            # Also find the configuration descriptors of the live
+            #   characteristics, for turning on their notifications
+            if key in LIVE_SENSORS:
+                try:
+                    descriptors = svchar_live[0].getDescriptors(forUUID=CCCD_UUID)
+                except BTLEException as e:
+                    self.logger.info("[{}] Descriptor discovery failed for {}: {}".format(
+                                        self.get_name(), key, str(e)))
+                    descriptors = []
+
+                if len(descriptors) > 0:
+                    cccd_handles[key] = descriptors[0].handle
+
+        handles["CCCD"] = cccd_handles
+
+        self.handles = handles
+        self.firmware_ver = firmware_ver_ch.read().decode("utf-8")
+
+        # Save the handles for later sessions
+        db = DryadDatabase()
+        result = db.insert_or_update_gatt_handles( address  = self.get_address(),
+                                                   firmware = self.firmware_ver,
+                                                   handles  = json.dumps(handles) )
+        db.close_session()
+
+        if result == False:
+            self.logger.error("[{}] Failed to save handles".format(self.get_name()))
 
         return True
 
@@ -212,17 +482,12 @@ class ParrotSensorNode(BleSensorNode):
             self.logger.error("[{}] Peripheral device unavailable".format(self.get_name()))
             return
 
-        # getting live services and controlling led and live measure period
-        self.live_service = self.peripheral.getServiceByUUID(UUID(SERVICES["LIVE"]))  
-
         # turning on live measure period, 1s
-        live_measure_ch = self.live_service.getCharacteristics(UUID(CONTROLS["LIVE_MODE_PERIOD"]))[0]
-        live_measure_ch.write(str.encode(self.live_measure_period))
+        self.peripheral.writeCharacteristic(self.handles["LIVE_MODE_PERIOD"],
+                                            str.encode(self.live_measure_period))
 
         return
 
     def switch_led(self, state):
-        led_control_ch = self.live_service.getCharacteristics(UUID(CONTROLS["LED"]))[0]
-        led_control_ch.write(str.encode(state))
+        self.peripheral.writeCharacteristic(self.handles["LED"], str.encode(state))
     
-
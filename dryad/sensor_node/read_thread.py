@@ -6,6 +6,7 @@
 #
 
 import logging
+import utils.transform as transform
 
 from time import time, sleep, ctime
 from threading import Thread
@@ -59,6 +60,8 @@ class ReadThread(Thread): #, metaclass=ABCMeta):
         # Setup the 'connection'
         self.parent.setup_connection()
 
+        read_start = time()
+
         try:
             self.read_time = time() + self.read_time
 
@@ -85,6 +88,7 @@ class ReadThread(Thread): #, metaclass=ABCMeta):
             self.notify_error()
 
         self.logger.info("[{}] Finished reading".format(self.parent.get_name()))
+        self.parent.read_duration = time() - read_start
 
         # Notify event completion
         self.notify_done()
@@ -113,23 +117,60 @@ class ReadThread(Thread): #, metaclass=ABCMeta):
         return
 
     def cache_reading(self, reading):
+        raw = reading.pop('raw', None)
         self.readings.append( reading )
 
+        # Archive the raw sample in place of the calibrated values
+        if raw != None:
+            return self.cache_raw_reading(raw, reading['ts'])
+
+        # Hand the reading off to the shared writer if there is one
+        if self.parent.data_writer != None:
+            if self.parent.data_writer.add_reading( self.parent.get_name(), reading ) == False:
+                print("Failed to add data")
+
+            return
+
         # Store the timestamp parameter
         ts = reading['ts']
 
-        # Store all other values
-        db = DryadDatabase()
+        # Otherwise, store all other values in a single transaction
+        rows = []
         for key in reading:
             if key == 'ts':
                 continue
 
-            result = db.add_session_data( self.parent.get_name(),
-                                  str("{}: {}".format(key, reading[key])),
-                                  ts )
-            if result == False:
+            rows.append( { 'source_id'  : self.parent.get_name(),
+                           'content'    : str("{}: {}".format(key, reading[key])),
+                           'timestamp'  : ts } )
+
+        db = DryadDatabase()
+        result = db.add_session_data_bulk(rows)
+        if result == False:
+            print("Failed to add data")
+
+        db.close_session()
+
+        return
+
+    def cache_raw_reading(self, raw, ts):
+        row = { 'source_id'   : self.parent.get_name(),
+                'sensor'      : raw['sensor'],
+                'cal_version' : transform.CALIBRATION_VERSION,
+                'raw'         : raw['data'],
+                'timestamp'   : ts }
+
+        if self.parent.data_writer != None:
+            if self.parent.data_writer.add_raw_reading(row) == False:
                 print("Failed to add data")
 
+            return
+
+        db = DryadDatabase()
+        result = db.add_raw_data_bulk([ row ])
+        if result == False:
+            print("Failed to add data")
+
         db.close_session()
 
         return
@@ -5,7 +5,17 @@
 #   Utility module abstracting the setting and retrieval of parameter data
 #   from the underlying system
 #
+import logging
+
+from threading import Lock
 from dryad.database import DryadDatabase
+from dryad.models import SystemParam
+
+module_logger = logging.getLogger("main.sys_info")
+
+# In-memory copy of the system parameters table, loaded on first use
+param_cache = None
+param_cache_lock = Lock()
 
 def get_info(name):
     db = DryadDatabase()
@@ -20,18 +30,95 @@ def set_info(name, val):
     db.close_session()
     return result
 
-def get_param(name):
+# @desc     Loads all system parameters into the parameter cache
+# @return   A dict of parameter names and values
+def load_params():
+    global param_cache
+
     db = DryadDatabase()
-    result = db.get_system_param(name)
+    records = db.get_all_system_params()
     db.close_session()
 
-    return result
+    params = {}
+    if records != False:
+        for record in records:
+            params[record.name] = record.value
+
+    param_cache = params
+
+    return params
+
+# @desc     Discards the parameter cache so that it is reloaded on next use
+# @return   None
+def invalidate_params():
+    global param_cache
+
+    param_cache_lock.acquire()
+    param_cache = None
+    param_cache_lock.release()
+
+    return
+
+def get_cached_params():
+    param_cache_lock.acquire()
+    try:
+        params = param_cache
+        if params is None:
+            params = load_params()
+    finally:
+        param_cache_lock.release()
+
+    return params
+
+def get_param(name):
+    params = get_cached_params()
+    if name not in params:
+        return False
+
+    return [ SystemParam(name=name, value=params[name]) ]
 
 def set_param(name, val):
     db = DryadDatabase()
     result = db.insert_or_update_system_param(name, val)
     db.close_session()
 
+    # Keep the parameter cache in step with the database
+    if result != False:
+        param_cache_lock.acquire()
+        if param_cache is not None:
+            param_cache[name] = val
+        param_cache_lock.release()
+
     return result
 
+# @desc     Gets a system parameter as a string. If the parameter does not
+#           exist yet, the default is saved in its place
+# @return   The parameter value or the default
+def get_str_param(name, default=None):
+    params = get_cached_params()
+    if name in params:
+        return params[name]
+
+    if default is not None:
+        set_param(name, str(default))
+
+    return default
+
+def get_int_param(name, default=None):
+    return get_typed_param(name, int, default)
+
+def get_float_param(name, default=None):
+    return get_typed_param(name, float, default)
+
+def get_typed_param(name, param_type, default=None):
+    value = get_str_param(name, default)
+    if value is None:
+        return None
+
+    try:
+        return param_type(value)
+    except ValueError:
+        module_logger.error("Invalid value for {}: {}".format(name, value))
+
+    return default
 
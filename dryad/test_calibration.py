@@ -0,0 +1,66 @@
+#
+#   Calibration Module Test
+#   Author: Francis T
+#
+#   Checks that the vectorized conversions match the scalar ones exactly
+#
+
+import struct
+import unittest
+import utils.calibration as calibration
+import utils.transform as transform
+
+from utils.transform import DataTransformation
+
+RAW_SAMPLES = [ 0, 1, 2, 100, 500, 700, 1000, 1771, 1772, 3000, 10000, 65535 ]
+
+class TestCalibration(unittest.TestCase):
+    def setUp(self):
+        self.tr = DataTransformation()
+        return
+
+    def check_conversion(self, func_vector, func_scalar):
+        expected = [ func_scalar(float(val)) for val in RAW_SAMPLES ]
+        packed = struct.pack("<{}H".format(len(RAW_SAMPLES)), *RAW_SAMPLES)
+
+        for result in [ func_vector(RAW_SAMPLES), func_vector(packed) ]:
+            self.assertEqual( len(result), len(expected) )
+            self.assertEqual( [ float(actual) for actual in result ], expected )
+
+        return
+
+    def test_conv_temp(self):
+        self.check_conversion(calibration.conv_temp, self.tr.conv_temp)
+        return
+
+    def test_conv_moisture(self):
+        self.check_conversion(calibration.conv_moisture, self.tr.conv_moisture)
+        return
+
+    def test_conv_light(self):
+        self.check_conversion(calibration.conv_light, self.tr.conv_light)
+        return
+
+    def test_conv_ec(self):
+        self.check_conversion(calibration.conv_ec, self.tr.conv_ec)
+        return
+
+    def test_non_U16_values(self):
+        vals = [ 0.5, 700.25, -3.0, 70000.0 ]
+        self.assertEqual( [ float(actual) for actual in calibration.conv_moisture(vals) ],
+                          [ self.tr.conv_moisture(val) for val in vals ] )
+        return
+
+    def test_calibrate_raw_bulk(self):
+        samples = [ transform.pack_raw("PARROT", { "sunlight" : val, "air_temp" : val + 1,
+                                                   "vwc" : val + 2, "pf_batt" : 80 })
+                    for val in RAW_SAMPLES[1:-1] ]
+        samples.append(transform.pack_raw("PARROT", { "cal_vwc" : 1.5, "pf_batt" : 70 }))
+
+        self.assertEqual( calibration.calibrate_raw_bulk("PARROT", samples),
+                          [ transform.calibrate_raw("PARROT", data) for data in samples ] )
+        return
+
+if __name__ == "__main__":
+    unittest.main()
+
@@ -0,0 +1,139 @@
+#
+#   Command Client Test
+#   Author: Francis T
+#
+#   Tests the pooled command connections used by the web server
+#
+
+import socket
+import unittest
+
+from threading import Thread
+
+import server
+import record_frames
+import message_framer
+
+class FakeAggregator(Thread):
+    def __init__(self, responses):
+        self.responses = responses
+        self.accept_count = 0
+        self.received = []
+
+        self.server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_sock.bind(("127.0.0.1", 0))
+        self.server_sock.listen(1)
+        self.port = self.server_sock.getsockname()[1]
+
+        Thread.__init__(self, daemon=True)
+        return
+
+    def run(self):
+        framer = message_framer.MessageFramer([ '\n', '\r', ';' ])
+
+        while True:
+            try:
+                client_sock, client_info = self.server_sock.accept()
+            except OSError:
+                return
+
+            self.accept_count += 1
+
+            self.serve(client_sock, framer)
+            client_sock.close()
+
+        return
+
+    def serve(self, client_sock, framer):
+        while True:
+            try:
+                data = client_sock.recv(1024)
+            except OSError:
+                return
+
+            if not data:
+                return
+
+            for msg in framer.feed(data):
+                req_hdr = msg.split(':')[0]
+                self.received.append(req_hdr)
+
+                # Unknown requests get no response, and a None response
+                #   drops the connection
+                if req_hdr not in self.responses:
+                    continue
+
+                if self.responses[req_hdr] == None:
+                    return
+
+                client_sock.sendall(self.responses[req_hdr])
+
+        return
+
+    def stop(self):
+        self.server_sock.close()
+        return
+
+class TestCommandClient(unittest.TestCase):
+    def setUp(self):
+        record = { 'rec_id'        : 1,
+                   'timestamp'     : 1000,
+                   'sampling_site' : "site",
+                   'data'          : { 'ph' : 7.0 },
+                   'origin'        : { 'name' : "n1", 'lat' : 1.0, 'lon' : 2.0, 'addr' : "---" } }
+
+        encoder = record_frames.RecordFrameEncoder(compress=record_frames.COMPRESS_ZLIB)
+        self.frames = encoder.encode_records([ record ]) + encoder.encode_end(1)
+
+        # The header and the frames are sent out together so that they
+        #   arrive in the same receive
+        self.aggregator = FakeAggregator({
+            "QDATA" : b"RDATA:BIN,format=json,compress=zlib;\r\n" + self.frames,
+            "QSTAT" : b"RSTAT:OK;\r\n",
+            "QDLTE" : None })
+        self.aggregator.start()
+
+        self.client = server.CommandClient("127.0.0.1", self.aggregator.port)
+        return
+
+    def tearDown(self):
+        for sock, last_used in self.client.idle_socks:
+            sock.close()
+
+        self.aggregator.stop()
+        return
+
+    def test_binary_then_text(self):
+        resp = self.client.send_command("QDATA:format=json,compress=zlib;\r\n")
+        self.assertEqual( resp, b"RDATA:BIN,format=json,compress=zlib;\r\n" + self.frames )
+
+        resp = self.client.send_command("QSTAT:;\r\n")
+        self.assertEqual( resp, "RSTAT:OK;\r\n" )
+
+        self.assertEqual( self.aggregator.accept_count, 1 )
+        return
+
+    def test_no_pooling_after_timeout(self):
+        timeout = server.RESPONSE_TIMEOUT
+        server.RESPONSE_TIMEOUT = 0.2
+        try:
+            self.assertEqual( self.client.send_command("QXXXX:;\r\n"), None )
+        finally:
+            server.RESPONSE_TIMEOUT = timeout
+
+        self.assertEqual( self.client.send_command("QSTAT:;\r\n"), "RSTAT:OK;\r\n" )
+        self.assertEqual( self.aggregator.accept_count, 2 )
+        return
+
+    def test_no_resend_of_changes(self):
+        self.client.send_command("QSTAT:;\r\n")
+
+        # The connection drops after the command has been received, so it
+        #   must not be sent again
+        self.assertEqual( self.client.send_command("QDLTE:name=n1;\r\n"), None )
+        self.assertEqual( self.aggregator.received.count("QDLTE"), 1 )
+        return
+
+if __name__ == "__main__":
+    unittest.main()
+
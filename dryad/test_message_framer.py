@@ -0,0 +1,40 @@
+#
+#   Message Framer Test
+#   Author: Francis T
+#
+#   Tests the splitting of received data into request messages
+#
+
+import unittest
+import message_framer
+
+class TestMessageFramer(unittest.TestCase):
+    def setUp(self):
+        self.framer = message_framer.MessageFramer([ '\n', '\r', ';' ], max_len=32)
+        return
+
+    def test_pipelined_messages(self):
+        self.assertEqual( self.framer.feed(b"QSTAT:;\r\nQDATA:limit=5;QNLST:;\r\n"),
+                          [ "QSTAT:;", "QDATA:limit=5;", "QNLST:;" ] )
+        return
+
+    def test_leftover_bytes(self):
+        self.assertEqual( self.framer.feed(b"QSTAT:;QDA"), [ "QSTAT:;" ] )
+        self.assertEqual( self.framer.feed(b"TA:limit=5"), [] )
+        self.assertEqual( self.framer.feed(b";\r\n"), [ "QDATA:limit=5;" ] )
+        return
+
+    def test_split_character(self):
+        data = "QCUPD:site_name=Peña;".encode("utf-8")
+        self.assertEqual( self.framer.feed(data[:19]), [] )
+        self.assertEqual( self.framer.feed(data[19:]), [ "QCUPD:site_name=Peña;" ] )
+        return
+
+    def test_max_len(self):
+        self.assertEqual( self.framer.feed(b"Q" * 40), [ "Q" * 40 ] )
+        self.assertEqual( self.framer.flush(), "" )
+        return
+
+if __name__ == "__main__":
+    unittest.main()
+
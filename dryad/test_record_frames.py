@@ -0,0 +1,62 @@
+#
+#   Record Frames Test
+#   Author: Francis T
+#
+#   Tests the compact framed encoding of data records
+#
+
+import unittest
+import record_frames
+
+def make_record(rec_id, name, data):
+    return { 'rec_id'        : rec_id,
+             'timestamp'     : 1000 + rec_id,
+             'sampling_site' : "site_" + name,
+             'data'          : data,
+             'origin'        : { 'name' : name, 'lat' : 1.0, 'lon' : 2.0, 'addr' : "---" } }
+
+class TestRecordFrames(unittest.TestCase):
+    def setUp(self):
+        self.chunks = [ [ make_record(1, "n1", { 'ph' : 7.0, 'temp' : 20.5 }),
+                          make_record(2, "n2", { 'ph' : None, 'temp' : 21.0 }) ],
+                        [ make_record(3, "n1", { 'ph' : 6.5, 'temp' : 22.0 }),
+                          make_record(4, "n1", { 'ph' : 6.0, 'bl_batt' : 90.0 }) ] ]
+        return
+
+    def encode(self, compress):
+        encoder = record_frames.RecordFrameEncoder(compress=compress)
+
+        data = b""
+        for records in self.chunks:
+            data += encoder.encode_records(records)
+        data += encoder.encode_end(4, next_id=4)
+
+        return data
+
+    def test_origins_sent_once(self):
+        messages = record_frames.decode_frames(self.encode(record_frames.COMPRESS_NONE))
+
+        self.assertEqual( [ o['name'] for o in messages[0]['origins'] ], [ "n1", "n2" ] )
+        self.assertEqual( messages[1]['origins'], [] )
+        self.assertEqual( messages[1]['schemas'], [ [ "bl_batt", "ph" ] ] )
+        self.assertEqual( messages[1]['rows'][1], [ 4, 1004, 0, 1, [ 90.0, 6.0 ] ] )
+        self.assertEqual( messages[2], { 'count' : 4, 'next_id' : 4 } )
+        self.assertEqual( len(messages), 3 )
+        return
+
+    def test_zlib_round_trip(self):
+        plain = record_frames.decode_frames(self.encode(record_frames.COMPRESS_NONE))
+        packed = record_frames.decode_frames(self.encode(record_frames.COMPRESS_ZLIB),
+                                             compress=record_frames.COMPRESS_ZLIB)
+        self.assertEqual( packed, plain )
+        return
+
+    def test_corrupted_frame(self):
+        data = bytearray(self.encode(record_frames.COMPRESS_NONE))
+        data[10] ^= 0xFF
+        self.assertRaises( ValueError, record_frames.decode_frames, data )
+        return
+
+if __name__ == "__main__":
+    unittest.main()
+
@@ -0,0 +1,57 @@
+#
+#   Sync Requests Test
+#   Author: Francis T
+#
+#   Tests the handling of malformed QSYNC and QSACK requests
+#
+
+import unittest
+
+from dryad.mobile_node.request_handler import RequestHandler
+
+class FakeLink():
+    def __init__(self):
+        self.responses = []
+        return
+
+    def send_response(self, resp_data):
+        self.responses.append(resp_data)
+        return True
+
+class FakeNode():
+    def get_version(self):
+        return "test"
+
+class TestSyncRequests(unittest.TestCase):
+    def setUp(self):
+        self.handler = RequestHandler(FakeNode())
+        self.link = FakeLink()
+        return
+
+    def check_fail(self, request, response):
+        self.link.responses = []
+        self.handler.handle_request(self.link, request)
+        self.assertEqual( self.link.responses, [ response ] )
+        return
+
+    def test_bad_sync_args(self):
+        self.check_fail("QSYNC:;", "RSYNC:FAIL;\r\n")
+        self.check_fail("QSYNC:client_id=p1,limit=abc;", "RSYNC:FAIL;\r\n")
+        self.check_fail("QSYNC:client_id=p1,limit=-5;", "RSYNC:FAIL;\r\n")
+        return
+
+    def test_bad_ack_args(self):
+        self.check_fail("QSACK:client_id=p1;", "RSACK:FAIL;\r\n")
+        self.check_fail("QSACK:client_id=p1,rec_id=;", "RSACK:FAIL;\r\n")
+        self.check_fail("QSACK:client_id=p1,rec_id=abc;", "RSACK:FAIL;\r\n")
+        self.check_fail("QSACK:client_id=p1,rec_id=-1,reset=1;", "RSACK:FAIL;\r\n")
+        return
+
+    def test_failures_recorded(self):
+        self.check_fail("QSACK:client_id=p1,rec_id=abc;", "RSACK:FAIL;\r\n")
+        self.assertEqual( self.handler.request_stats.get_stats()['commands']['QSACK']['count'], 1 )
+        return
+
+if __name__ == "__main__":
+    unittest.main()
+
@@ -2,11 +2,13 @@ import unittest
 import time
 import sys_info
 
+from dryad.database import init_database
+
 
 class TestSysInfo(unittest.TestCase):
     # Executed before each test method
     def setUp(self):
-        pass
+        init_database()
 
     # Executed after each test method
     def tearDown(self):
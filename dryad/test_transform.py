@@ -0,0 +1,78 @@
+#
+#   Transform Lookup Table Test
+#   Author: Francis T
+#
+#   Checks that the conversion lookup tables match the conversion formulas
+#
+
+import shutil
+import struct
+import tempfile
+import unittest
+import utils.transform as transform
+
+class TestLookupTables(unittest.TestCase):
+    def setUp(self):
+        self.tr = transform.DataTransformation()
+        self.cache_dir = tempfile.mkdtemp()
+        return
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        return
+
+    def test_lut_parity(self):
+        for name in transform.LUT_CONVERSIONS:
+            func_conv = getattr(self.tr, name)
+            lut = transform.get_lut(name)
+
+            self.assertEqual( len(lut), transform.LUT_SIZE )
+            for val in range(transform.LUT_SIZE):
+                self.assertEqual( lut[val], func_conv(float(val)) )
+        return
+
+    def test_mapped_lut(self):
+        built = transform.get_lut("conv_moisture")
+        mapped = transform.get_lut("conv_moisture", cache_dir=self.cache_dir)
+
+        self.assertEqual( list(mapped), list(built) )
+        return
+
+    def test_lookup(self):
+        for val in [ 0, 1, 700, 1771, 65535 ]:
+            packed = struct.pack("<H", val)
+            self.assertEqual( self.tr.lookup("conv_temp", packed),
+                              self.tr.conv_temp(float(val)) )
+        return
+
+class TestRawSamples(unittest.TestCase):
+    def test_pack_raw(self):
+        values = { "sunlight" : 700, "vwc" : 1200, "cal_vwc" : 1.5, "pf_batt" : 80 }
+        packed = transform.pack_raw("PARROT", values)
+
+        self.assertEqual( transform.unpack_raw("PARROT", packed), values )
+        return
+
+    def test_calibrate_raw(self):
+        tr = transform.DataTransformation()
+        packed = transform.pack_raw("PARROT", { "air_temp" : 700, "pf_batt" : 80 })
+        reading = transform.calibrate_raw("PARROT", packed)
+
+        self.assertEqual( reading["air_temp"], tr.conv_temp(700.0) )
+        self.assertEqual( reading["cal_air_temp"], reading["air_temp"] )
+        self.assertEqual( reading["pf_batt"], 80 )
+        self.assertTrue( "sunlight" not in reading )
+        return
+
+class TestPackedValues(unittest.TestCase):
+    def test_can_pack_values(self):
+        self.assertTrue( transform.can_pack_values([ "21.5", 7.0, 3, None, "None" ]) )
+        self.assertFalse( transform.can_pack_values([ "21.5", "ERR" ]) )
+        self.assertFalse( transform.can_pack_values([ float("nan") ]) )
+        self.assertFalse( transform.can_pack_values([ True ]) )
+        self.assertFalse( transform.can_pack_values([ 2**60 + 1 ]) )
+        return
+
+if __name__ == "__main__":
+    unittest.main()
+
@@ -5,15 +5,20 @@
 #   Source code for the "main" point-of-entry into the program
 #
 import logging
+import time
 
 from threading import Event, Thread
 from dryad.mobile_node.link_listener import LinkListenerThread
 from dryad.flask_link.flask_listener import FlaskListenerThread
 from dryad.mobile_node.request_handler import RequestHandler
-from dryad.aggregator_node.core import AggregatorNode
+from dryad.aggregator_node.core import AggregatorNode, EXIT_RELOAD
+from dryad.aggregator_node.task import parse_task
+from dryad.database import init_database
+from utils.transform import preload_luts
 
 VERSION = "2.0.0"
 DEBUG_CONSOLE_ENABLED = False
+DB_INIT_RETRY_DELAY = 10.0
 
 class DummyLink():
     def __init__(self):
@@ -48,7 +53,7 @@ class InputThread(Thread):
                 self.request_handler.handle_request(self.link, request)
 
             else:
-                self.receiver.add_task(cmd)
+                self.receiver.add_task(parse_task(cmd))
 
         return
 
@@ -89,6 +94,17 @@ class DryadMain():
 
         completion_event = Event()
 
+        # Set up the shared database engine and schema
+        if init_database() == False:
+            self.logger.error("Failed to initialize the database")
+
+            # Have the run script start the program again after a while
+            time.sleep(DB_INIT_RETRY_DELAY)
+            return EXIT_RELOAD
+
+        # Build the sensor value lookup tables before any node is read
+        preload_luts()
+
         # Initialize the main Aggregator Node module
         agn = AggregatorNode()
         agn.start(completion_event)
@@ -1,12 +1,31 @@
-from flask import Flask, request, render_template
-from threading import Thread
-from time import sleep
+from flask import Flask, Response, request, render_template
+from threading import Thread, Lock
+from time import sleep, time
+import hashlib
 import socket
 import logging
+import json
+
+from dryad.database import DryadDatabase
+from dryad.data_records import iter_records
+from dryad.record_frames import FRAME_HEADER
 
 HOST = 'localhost'        # Symbolic name meaning all available interfaces
 PORT = 50007              # Arbitrary non-privileged port
 
+RESPONSE_TERM        = b';\r\n'   # Every text response ends with this
+BINARY_HEADER_TAG    = b'BIN,'    # Marks the header of a binary response
+RESPONSE_TIMEOUT     = 10.0
+RECEIVE_LEN          = 4096
+MAX_IDLE_CONNECTIONS = 4
+MAX_IDLE_TIME        = 60.0       # Kept well below the aggregator's idle timeout
+
+# Commands which may safely be sent again if the connection drops
+READ_ONLY_COMMANDS   = [ "QSTAT", "QNLST", "QPARL", "QINFO", "QDATA", "QPERF", "QSYNC" ]
+
+DEFAULT_PAGE_LIMIT   = 500        # Records per page of the read API
+MAX_PAGE_LIMIT       = 5000
+
 logger = None
 
 available_commands = [
@@ -29,6 +48,9 @@ available_commands = [
     { "cmd_name" : "QPARL", "desc" : "Lists currently saved parameters"},
     { "cmd_name" : "QINFO", "desc" : "Retrieves system info"},
     { "cmd_name" : "QDATA", "desc" : "Retrieves data"},
+    { "cmd_name" : "QPERF", "desc" : "Retrieves request counts and latencies"},
+    { "cmd_name" : "QSYNC", "desc" : "Starts or resumes a data sync for a client"},
+    { "cmd_name" : "QSACK", "desc" : "Acknowledges synced data up to a record id"},
 ]
 
 app = Flask(__name__)
@@ -96,31 +118,292 @@ def kill_server():
     return 'Server shutting down'
 
 
+###    S.0.2. Read API Functions    ###
+
+@app.route('/api/data')
+def api_data():
+    after_id = request.args.get('after_id', 0, type=int)
+    limit = get_page_limit()
+    is_raw = (request.args.get('raw', '0') == '1')
+
+    # Only look at what has changed since the client's copy instead of
+    #   reading the page itself
+    db = DryadDatabase()
+    version = db.get_data_version(is_raw)
+    db.close_session()
+
+    etag = make_etag(json.dumps([ after_id, limit, is_raw, version ]))
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+
+    resp = Response(stream_data(after_id, limit, is_raw),
+                    mimetype='application/json')
+    resp.set_etag(etag)
+
+    return resp
+
+@app.route('/api/nodes')
+def api_nodes():
+    db = DryadDatabase()
+
+    nodes = []
+    for node in db.get_nodes() or []:
+        devices = []
+        for device in db.get_devices(name=node.name) or []:
+            devices.append( { 'address'     : device.address,
+                              'device_type' : device.device_type.name,
+                              'power'       : device.power } )
+
+        nodes.append( { 'name'       : node.name,
+                        'node_class' : node.node_class.name,
+                        'site_name'  : node.site_name,
+                        'lat'        : node.lat,
+                        'lon'        : node.lon,
+                        'devices'    : devices } )
+
+    db.close_session()
+
+    return json_response({ 'nodes' : nodes })
+
+@app.route('/api/sessions')
+def api_sessions():
+    after_id = request.args.get('after_id', 0, type=int)
+    limit = get_page_limit()
+
+    db = DryadDatabase()
+
+    sessions = []
+    for session in db.get_sessions(record_limit=limit, after_id=after_id) or []:
+        sessions.append( { 'id'         : session.id,
+                           'start_time' : session.start_time,
+                           'end_time'   : session.end_time } )
+
+    db.close_session()
+
+    next_id = None
+    if len(sessions) >= limit:
+        next_id = sessions[-1]['id']
+
+    return json_response({ 'sessions' : sessions, 'next_id' : next_id })
+
+@app.route('/api/params')
+def api_params():
+    db = DryadDatabase()
+
+    params = {}
+    for param in db.get_all_system_params() or []:
+        params[param.name] = param.value
+
+    db.close_session()
+
+    return json_response({ 'params' : params })
+
+
 ###    S.1.1. Utility Functions    ###
 
-def send_command(cmd):
-    resp = None
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.connect((HOST, PORT))
-        s.settimeout(3.0)
+class CommandClient():
+    """ Keeps a pool of open connections to the Aggregator Node's command
+        socket. Each in-flight command uses its own connection, and idle
+        connections are reused by later commands """
+    def __init__(self, host, port, max_idle=MAX_IDLE_CONNECTIONS):
+        self.host = host
+        self.port = port
+        self.max_idle = max_idle
+
+        # Idle connections as (socket, last used time) pairs
+        self.idle_socks = []
+        self.lock = Lock()
+        return
+
+    def send_command(self, cmd):
+        sock, is_reused = self.acquire()
+        is_sent = False
+
+        try:
+            sock.sendall(cmd.encode('UTF-8'))
+            is_sent = True
+
+            resp = self.receive_response(sock)
+
+        except socket.timeout:
+            # Some requests never get a response. Never pool the connection
+            #   afterwards, since a late response would be mistaken for the
+            #   response to the next command
+            sock.close()
+            print("No response within {} secs: {}".format(RESPONSE_TIMEOUT, cmd.strip()))
+            return None
+
+        except ConnectionError as e:
+            sock.close()
+
+            # The aggregator may have closed a reused connection while it
+            #   was idle. Only try again over another connection if the
+            #   command cannot have been carried out already, or if doing
+            #   it twice does no harm
+            if is_reused and ((not is_sent) or is_read_only(cmd)):
+                return self.send_command(cmd)
+
+            print("Exception occurred: {}".format(str(e)))
+            return None
+
+        except Exception as e:
+            # Drop the connection since a late response would be mistaken
+            #   for the response to the next command
+            sock.close()
+            print("Exception occurred: {}".format(str(e)))
+            return None
+
+        self.release(sock)
+
+        return resp
+
+    def acquire(self):
+        self.lock.acquire()
+        try:
+            while len(self.idle_socks) > 0:
+                sock, last_used = self.idle_socks.pop()
+                if (time() - last_used < MAX_IDLE_TIME) and is_idle_socket_open(sock):
+                    return sock, True
+
+                sock.close()
+        finally:
+            self.lock.release()
+
+        sock = socket.create_connection((self.host, self.port), RESPONSE_TIMEOUT)
+        return sock, False
+
+    def release(self, sock):
+        self.lock.acquire()
+        if len(self.idle_socks) < self.max_idle:
+            self.idle_socks.append((sock, time()))
+            sock = None
+        self.lock.release()
+
+        if sock != None:
+            sock.close()
+
+        return
+
+    def receive_response(self, sock):
+        resp = bytearray()
+
+        # Read until the response terminator comes in, looking only at the
+        #   new bytes and the few before them
+        while True:
+            scan_pos = max(len(resp) - len(RESPONSE_TERM) + 1, 0)
+            self.receive_more(sock, resp)
+
+            term_pos = resp.find(RESPONSE_TERM, scan_pos)
+            if term_pos >= 0:
+                break
 
-        s.sendall(cmd.encode('UTF-8'))
+        # Binary data responses only start with a text header, after which
+        #   come length-prefixed frames up to an empty end frame
+        header_len = term_pos + len(RESPONSE_TERM)
+        header_parts = bytes(resp[:term_pos]).split(b':', 1)
+        if (len(header_parts) < 2) or not header_parts[1].startswith(BINARY_HEADER_TAG):
+            return resp.decode('UTF-8')
 
-        resp = ""
+        frame_pos = header_len
         while True:
-            try:
-                data = s.recv(1024)
-            except Exception as e:
-                print("Exception occurred: {}".format(str(e)))
+            while len(resp) < frame_pos + FRAME_HEADER.size:
+                self.receive_more(sock, resp)
+
+            length, checksum = FRAME_HEADER.unpack_from(resp, frame_pos)
+            frame_pos += FRAME_HEADER.size + length
+            if length == 0:
                 break
 
-            if not data: break
-            resp += str(data)
+        while len(resp) < frame_pos:
+            self.receive_more(sock, resp)
+
+        return bytes(resp)
+
+    def receive_more(self, sock, resp):
+        data = sock.recv(RECEIVE_LEN)
+        if not data:
+            raise ConnectionError("Connection closed by the aggregator")
+
+        resp.extend(data)
+        return
+
+command_client = CommandClient(HOST, PORT)
+
+def send_command(cmd):
+    return command_client.send_command(cmd)
+
+def stream_data(after_id, limit, is_raw):
+    db = DryadDatabase()
+
+    try:
+        yield '{"data": ['
+
+        last_id = after_id
+        send_count = 0
+        for records in iter_records(db, limit=limit, after_id=after_id, is_raw=is_raw):
+            data = ", ".join([ json.dumps(record) for record in records ])
+            if send_count > 0:
+                data = ", " + data
 
-        s.shutdown(socket.SHUT_RDWR)
+            yield data
 
+            send_count += len(records)
+            last_id = records[-1]['rec_id']
+
+        # A full page may be followed by more records
+        next_id = last_id if send_count >= limit else None
+        yield '], "next_id": {}}}'.format(json.dumps(next_id))
+
+    finally:
+        # Also reached when the client goes away mid-stream
+        db.close_session()
+
+    return
+
+def get_page_limit():
+    limit = request.args.get('limit', DEFAULT_PAGE_LIMIT, type=int)
+    return max(1, min(limit, MAX_PAGE_LIMIT))
+
+def make_etag(content):
+    return hashlib.sha1(content.encode('UTF-8')).hexdigest()
+
+def not_modified(etag):
+    resp = Response(status=304)
+    resp.set_etag(etag)
     return resp
 
+def json_response(payload):
+    body = json.dumps(payload)
+
+    etag = make_etag(body)
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+
+    resp = Response(body, mimetype='application/json')
+    resp.set_etag(etag)
+
+    return resp
+
+def is_read_only(cmd):
+    return cmd.strip().split(':', 1)[0].upper() in READ_ONLY_COMMANDS
+
+def is_idle_socket_open(sock):
+    # An open idle connection has nothing to read yet. Sockets with a
+    #   timeout wait for data even with MSG_DONTWAIT, so look without one
+    sock.setblocking(False)
+    try:
+        data = sock.recv(1, socket.MSG_PEEK)
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.settimeout(RESPONSE_TIMEOUT)
+
+    # Either the aggregator has closed the connection, or stray bytes of
+    #   an earlier response are waiting
+    return False
+
 def shutdown_server():
     func = request.environ.get('werkzeug.server.shutdown')
     if func is None:
@@ -0,0 +1,63 @@
+#
+#   Transform Benchmark
+#   Author: Francis T
+#
+#   Compares converting raw Parrot sensor values through their formulas
+#   against indexing the precomputed lookup tables, and checks that both
+#   give the same results for every possible raw value
+#
+#   Usage: python3 -m utils.bench_transform [cache_dir]
+#
+import sys
+import struct
+import random
+
+from timeit import timeit
+from utils.transform import DataTransformation, get_lut, LUT_SIZE, LUT_CONVERSIONS
+
+SAMPLE_COUNT = 100000
+
+def check_parity(name, lut):
+    func_conv = getattr(DataTransformation(), name)
+
+    mismatches = 0
+    for val in range(LUT_SIZE):
+        # Compare the exact bit patterns of the values
+        if struct.pack("d", func_conv(float(val))) != struct.pack("d", lut[val]):
+            mismatches += 1
+
+    return mismatches
+
+def benchmark(name, lut, samples):
+    func_conv = getattr(DataTransformation(), name)
+
+    formula_time = timeit(lambda: [ func_conv(float(val)) for val in samples ], number=1)
+    lut_time     = timeit(lambda: [ lut[val] for val in samples ], number=1)
+
+    return formula_time, lut_time
+
+def main():
+    cache_dir = None
+    if len(sys.argv) > 1:
+        cache_dir = sys.argv[1]
+
+    samples = [ random.randint(0, LUT_SIZE - 1) for i in range(SAMPLE_COUNT) ]
+
+    print("{:<16}{:>12}{:>12}{:>12}{:>10}{:>12}".format(
+            "Conversion", "Build (s)", "Formula (s)", "Table (s)", "Speedup", "Mismatches"))
+
+    for name in LUT_CONVERSIONS:
+        build_time = timeit(lambda: get_lut(name, cache_dir=cache_dir), number=1)
+        lut = get_lut(name, cache_dir=cache_dir)
+
+        formula_time, lut_time = benchmark(name, lut, samples)
+        mismatches = check_parity(name, lut)
+
+        print("{:<16}{:>12.4f}{:>12.4f}{:>12.4f}{:>9.1f}x{:>12}".format(
+                name, build_time, formula_time, lut_time, formula_time / lut_time, mismatches))
+
+    return
+
+if __name__ == "__main__":
+    main()
+
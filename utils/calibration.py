@@ -0,0 +1,123 @@
+#
+#   Calibration Module
+#   Author: Francis T
+#
+#   Array-oriented versions of the sensor value conversions in
+#   utils.transform for calibrating many raw values at once. Results are
+#   identical to those of the scalar conversions: raw U16 samples are
+#   looked up in the conversion tables (which are built from the scalar
+#   conversions), and any other values go through the scalar conversions
+#   themselves. Evaluating the formulas with NumPy does not give identical
+#   results, since NumPy's power() rounds differently from the C library
+#   pow() used by the scalar conversions
+#
+import struct
+
+from utils.transform import DataTransformation, get_lut, unpack_raw
+from utils.transform import LUT_SIZE, LUT_CONVERSIONS, CALIBRATIONS
+from utils.transform import CALIBRATION_VERSION, RAW_FALLBACKS
+
+# NumPy is optional. Without it, the same lookups and conversions are done
+#   one value at a time and the results are returned as lists
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def is_vectorized():
+    return np is not None
+
+# @desc     Unpacks a buffer of little-endian unsigned 16-bit samples
+# @return   An array (or a list without NumPy) of float values
+def unpack_U16(buf):
+    if np is None:
+        return [ float(val) for val in struct.unpack("<{}H".format(len(buf) // 2), buf) ]
+
+    return np.frombuffer(buf, dtype="<u2").astype(np.float64)
+
+# @desc     Converts the input into an array of floats. Packed U16 sample
+#           buffers are unpacked first
+# @return   An array (or a list without NumPy) of float values
+def to_values(vals):
+    if isinstance(vals, (bytes, bytearray, memoryview)):
+        return unpack_U16(bytes(vals))
+
+    if np is None:
+        return [ float(val) for val in vals ]
+
+    return np.asarray(vals, dtype=np.float64)
+
+# @desc     Checks whether all values are possible raw U16 samples
+# @return   True if they all are, otherwise False
+def is_U16(vals):
+    if np is None:
+        return all([ val.is_integer() and (0 <= val < LUT_SIZE) for val in vals ])
+
+    if len(vals) <= 0:
+        return True
+
+    return bool(np.all(vals == np.floor(vals)) and
+                (vals.min() >= 0) and (vals.max() < LUT_SIZE))
+
+# @desc     Applies one of the DataTransformation conversions to many values
+# @return   An array (or a list without NumPy) of the converted values
+def convert(name, vals):
+    vals = to_values(vals)
+
+    if (name in LUT_CONVERSIONS) and is_U16(vals):
+        lut = get_lut(name)
+        if np is None:
+            return [ lut[int(val)] for val in vals ]
+
+        return np.frombuffer(lut, dtype=np.float64)[vals.astype(np.intp)]
+
+    func_conv = getattr(DataTransformation(), name)
+    if np is None:
+        return [ func_conv(val) for val in vals ]
+
+    return np.array([ func_conv(val) for val in vals ], dtype=np.float64)
+
+def conv_temp(vals):
+    return convert("conv_temp", vals)
+
+def conv_moisture(vals):
+    return convert("conv_moisture", vals)
+
+def conv_light(vals):
+    return convert("conv_light", vals)
+
+def conv_ec(vals):
+    return convert("conv_ec", vals)
+
+# @desc     Calibrates many samples packed with pack_raw() at once,
+#           converting each field across all of the samples together
+# @return   A list of dicts of the calibrated values present in each sample,
+#           matching those given by calibrate_raw()
+def calibrate_raw_bulk(sensor, samples, cal_version=CALIBRATION_VERSION):
+    if cal_version not in CALIBRATIONS:
+        raise ValueError("Unknown calibration version: {}".format(cal_version))
+
+    conversions = CALIBRATIONS[cal_version]
+    readings = [ unpack_raw(sensor, data) for data in samples ]
+
+    # Gather the values of each converted field along with the samples
+    #   they came from
+    columns = {}
+    for idx, reading in enumerate(readings):
+        for key in reading:
+            if key in conversions:
+                columns.setdefault(key, ([], []))
+                columns[key][0].append(idx)
+                columns[key][1].append(reading[key])
+
+    for key, (indices, vals) in columns.items():
+        for idx, val in zip(indices, convert(conversions[key], vals)):
+            readings[idx][key] = float(val)
+
+    for reading in readings:
+        for cal_key, key in RAW_FALLBACKS:
+            if (cal_key not in reading) and (key in reading):
+                reading[cal_key] = reading[key]
+
+    return readings
+
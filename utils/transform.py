@@ -1,10 +1,228 @@
+import os
+import mmap
 import struct
 
+from array import array
+from threading import Lock
+
+# Every raw Parrot sensor value is an unsigned 16-bit integer, so each of
+#   these conversions can be precomputed into a table of 65536 values
+LUT_SIZE            = 65536
+LUT_CONVERSIONS     = [ "conv_temp", "conv_moisture", "conv_light", "conv_ec" ]
+
+# Increment this whenever any of the conversions above is changed so that
+#   stale lookup table cache files are not reused
+LUT_FORMULA_VERSION = 1
+
+lut_cache = {}
+lut_cache_lock = Lock()
+
+# @desc     Gets the lookup table for a conversion, building it on first use.
+#           Tables hold doubles by default, matching the formulas exactly;
+#           typecode 'f' halves their size at the cost of precision. If a
+#           cache directory is given, the table is memory-mapped from a
+#           cache file there, which is created if needed
+# @return   An indexable sequence of LUT_SIZE converted values
+def get_lut(name, typecode='d', cache_dir=None):
+    if name not in LUT_CONVERSIONS:
+        raise ValueError("No lookup table for {}".format(name))
+
+    key = (name, typecode, cache_dir)
+
+    lut_cache_lock.acquire()
+    try:
+        if key not in lut_cache:
+            if cache_dir == None:
+                lut_cache[key] = build_lut(name, typecode)
+            else:
+                lut_cache[key] = map_lut(name, typecode, cache_dir)
+        lut = lut_cache[key]
+    finally:
+        lut_cache_lock.release()
+
+    return lut
+
+# @desc     Builds the default lookup table of every conversion up front so
+#           that the first sensor readings do not have to wait for them
+# @return   None
+def preload_luts():
+    for name in LUT_CONVERSIONS:
+        get_lut(name)
+
+    return
+
+def build_lut(name, typecode='d'):
+    func_conv = getattr(DataTransformation(), name)
+    return array(typecode, [ func_conv(float(val)) for val in range(LUT_SIZE) ])
+
+def map_lut(name, typecode, cache_dir):
+    file_name = "{}_v{}_{}.lut".format(name, LUT_FORMULA_VERSION, typecode)
+    file_path = os.path.join(cache_dir, file_name)
+    file_size = LUT_SIZE * array(typecode).itemsize
+
+    if (not os.path.exists(file_path)) or (os.path.getsize(file_path) != file_size):
+        # Write to a temporary file first so that other processes never
+        #   map a partially written table
+        temp_path = "{}.{}.tmp".format(file_path, os.getpid())
+        with open(temp_path, "wb") as lut_file:
+            build_lut(name, typecode).tofile(lut_file)
+        os.replace(temp_path, file_path)
+
+    with open(file_path, "rb") as lut_file:
+        lut_map = mmap.mmap(lut_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    return memoryview(lut_map).cast(typecode)
+
+# Layouts of the packed raw samples kept in raw archival mode, as a list of
+#   (key, struct format) pairs for each sensor type. A packed sample starts
+#   with a U16 bitmask of the fields present, followed by the values of
+#   those fields in layout order. Fields may only ever be appended
+RAW_LAYOUTS = {
+    "PARROT" : [ ("sunlight", "H"), ("soil_temp", "H"), ("air_temp", "H"),
+                 ("vwc", "H"), ("cal_vwc", "f"), ("cal_air_temp", "f"),
+                 ("cal_dli", "f"), ("cal_ea", "f"), ("cal_ecb", "f"),
+                 ("cal_ec_porous", "f"), ("pf_batt", "B") ],
+    "BLUNO"  : [ ("ph", "d"), ("bl_batt", "d") ],
+}
+
+# Conversions applied to raw values by each calibration version. Raw values
+#   of keys without a conversion are used as they are
+CALIBRATIONS = {
+    1 : { "sunlight"  : "conv_light",
+          "soil_temp" : "conv_temp",
+          "air_temp"  : "conv_temp",
+          "vwc"       : "conv_moisture",
+          "ph"        : "conv_ph",
+          "bl_batt"   : "conv_batt" },
+}
+CALIBRATION_VERSION = 1
+
+# Values taken in place of the calibrated values missing from older firmware
+RAW_FALLBACKS = [ ("cal_vwc", "vwc"), ("cal_air_temp", "air_temp") ]
+
+# @desc     Decodes a single raw field as read from the device
+# @return   The raw numeric value
+def unpack_raw_field(sensor, key, val):
+    for field_key, field_fmt in RAW_LAYOUTS[sensor]:
+        if field_key == key:
+            return struct.unpack("<" + field_fmt, val)[0]
+
+    raise ValueError("No raw field {} for {}".format(key, sensor))
+
+# @desc     Packs the raw values of a sample into the compact raw layout of
+#           its sensor type. Missing or None values are left out
+# @return   The packed sample as bytes
+def pack_raw(sensor, values):
+    mask = 0
+    fmt = "<H"
+    packed_values = []
+
+    for idx, (key, field_fmt) in enumerate(RAW_LAYOUTS[sensor]):
+        if values.get(key) is None:
+            continue
+
+        mask |= (1 << idx)
+        fmt += field_fmt
+        packed_values.append(values[key])
+
+    return struct.pack(fmt, mask, *packed_values)
+
+# @desc     Unpacks a sample packed with pack_raw()
+# @return   A dict of the raw values present in the sample
+def unpack_raw(sensor, data):
+    layout = RAW_LAYOUTS[sensor]
+    mask = struct.unpack_from("<H", data)[0]
+
+    fmt = "<"
+    keys = []
+    for idx, (key, field_fmt) in enumerate(layout):
+        if mask & (1 << idx):
+            fmt += field_fmt
+            keys.append(key)
+
+    return dict(zip(keys, struct.unpack_from(fmt, data, 2)))
+
+# @desc     Calibrates a sample packed with pack_raw()
+# @return   A dict of the calibrated values present in the sample
+def calibrate_raw(sensor, data, cal_version=CALIBRATION_VERSION):
+    if cal_version not in CALIBRATIONS:
+        raise ValueError("Unknown calibration version: {}".format(cal_version))
+
+    tr = DataTransformation()
+    conversions = CALIBRATIONS[cal_version]
+
+    reading = {}
+    for key, val in unpack_raw(sensor, data).items():
+        if key in conversions:
+            reading[key] = getattr(tr, conversions[key])(float(val))
+        else:
+            reading[key] = val
+
+    for cal_key, key in RAW_FALLBACKS:
+        if (cal_key not in reading) and (key in reading):
+            reading[cal_key] = reading[key]
+
+    return reading
+
+# @desc     Packs the values of a data block as little-endian doubles.
+#           Values which are missing or not numeric are packed as NaN
+# @return   The packed values as bytes
+def pack_values(values):
+    packed_values = []
+    for val in values:
+        try:
+            packed_values.append(float(val))
+        except (TypeError, ValueError):
+            packed_values.append(float("nan"))
+
+    return struct.pack("<{}d".format(len(packed_values)), *packed_values)
+
+# @desc     Checks that pack_values() keeps every value. Numeric strings
+#           (as kept in the session data) count as their numbers, while
+#           None and "None" count as missing values
+# @return   True if no value would be lost, otherwise False
+def can_pack_values(values):
+    for val in values:
+        if (val is None) or (val == "None"):
+            continue
+
+        if isinstance(val, bool):
+            return False
+
+        try:
+            num = float(val)
+        except (TypeError, ValueError):
+            return False
+
+        # NaN marks missing values, and large integers lose precision
+        if num != num:
+            return False
+
+        if isinstance(val, int) and (int(num) != val):
+            return False
+
+    return True
+
+# @desc     Unpacks values packed with pack_values()
+# @return   A list of floats, with None in place of NaN
+def unpack_values(data):
+    values = struct.unpack("<{}d".format(len(data) // 8), data)
+    return [ None if (val != val) else val for val in values ]
+
 ## data value conversions
 class DataTransformation():
     def unpack_U16(self, val):
         return float(struct.unpack("<H", val)[0])
 
+    def unpack_U16_int(self, val):
+        return struct.unpack("<H", val)[0]
+
+    # @desc     Converts a packed U16 sensor value using the lookup table of
+    #           the given conversion instead of evaluating its formula
+    # @return   The converted value
+    def lookup(self, name, val):
+        return get_lut(name)[self.unpack_U16_int(val)]
+
     def decode_float32(self, val):
         return struct.unpack('f', val)[0]
 